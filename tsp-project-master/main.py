@@ -2,8 +2,10 @@
 
 import csv
 
-from src import initialize, evaluate, offspring_generation, \
-    select, data_import
+from src import initialize, evaluate, island, parallel, data_import, checkpoint, runner, telemetry
+from src.memory import MemoryTracker
+from src.profiler import Profiler
+from src.telemetry import stage
 from src.utility import *
 import multiprocessing as mp
 import matplotlib.pyplot as plt
@@ -14,12 +16,28 @@ def main():
     print("EA-TSP by E Garg, S Parson, T Rahman, J Wagner")
 
     # Get the command line arguments, and load the algorithm parameters
-    # from a file. Also, read the data file and calculate the node distance
-    # matrix.
+    # from a file. With --debug, every stage from here on is profiled, and
+    # with --memory, the memory use of every stage is tracked.
     cmd_args = parse_args()
     args = load_params_from_file(cmd_args.args_file)
-    data_import.parse_datafile(args)
-    data_import.calc_distance_matrix(args)
+    if cmd_args.debug:
+        args['profiler'] = Profiler(args, "{}.profile.json".format(cmd_args.args_file),
+                                    "{}.prof".format(cmd_args.args_file))
+    if cmd_args.memory:
+        args['memory_tracking'] = True
+    if args.get('memory_tracking', False):
+        args['memory_tracker'] = MemoryTracker(args, "{}.memory.json".format(cmd_args.args_file))
+
+    # Read the data file and calculate the node distance matrix, the spatial
+    # index over the cities and the candidate neighbours of every city.
+    with stage(args, 'read_datafile'):
+        data_import.parse_datafile(args)
+    with stage(args, 'distance_matrix'):
+        data_import.calc_distance_matrix(args)
+    with stage(args, 'spatial_index'):
+        data_import.calc_spatial_index(args)
+    with stage(args, 'neighbours'):
+        data_import.calc_neighbours(args)
 
     # Display the runtime arguments to the user
     print_config(args)
@@ -33,10 +51,39 @@ def main():
         print("WARNING: Can't plot real-time data for more than one test run!")
         cmd_args.visualize = False
 
-    # Just display algorithmic speed information for one generation and then
-    # exit
-    if cmd_args.debug:
-        print_performance_metrics(args)
+    # The islands run in their own processes
+    islands = args.get('islands', 1) > 1
+    if islands and cmd_args.visualize:
+        print("WARNING: Can't plot real-time data for the island model!")
+        cmd_args.visualize = False
+    if islands and args.get('parallel_offspring', False):
+        print("WARNING: The parallel offspring pipeline is not used by the island model!")
+        args['parallel_offspring'] = False
+    if islands and (cmd_args.resume or 'checkpoint_interval' in args or 'checkpoint_seconds' in args):
+        print("WARNING: Checkpoints are not supported by the island model!")
+        cmd_args.resume = False
+    if islands and 'telemetry_file' in args:
+        print("WARNING: Telemetry is not recorded by the island model!")
+    if islands and args.get('memory_tracking', False):
+        print("WARNING: The memory of the island processes is not tracked!")
+
+    # Independent runs can be done concurrently, one per worker process
+    jobs = max(1, min(cmd_args.jobs, cmd_args.test_runs))
+    if jobs > 1 and islands:
+        print("WARNING: --jobs is not supported by the island model!")
+        jobs = 1
+    if jobs > 1 and args.get('parallel_offspring', False):
+        print("WARNING: The parallel offspring pipeline is not used with --jobs!")
+        args['parallel_offspring'] = False
+    if jobs > 1 and (cmd_args.resume or 'checkpoint_interval' in args or 'checkpoint_seconds' in args):
+        print("WARNING: Checkpoints are not supported with --jobs!")
+        cmd_args.resume = False
+    if jobs > 1 and 'telemetry_file' in args:
+        print("WARNING: Telemetry is not recorded with --jobs!")
+
+    # The profiler only sees the main process
+    if cmd_args.debug and (islands or jobs > 1):
+        print("WARNING: Only the stages in the main process are profiled!")
 
     # Create a graphical display if specified.
     if cmd_args.visualize:
@@ -44,38 +91,91 @@ def main():
 
     # If the user would like to export the results to a file, set up a
     # file to do so.
+    # (A resumed run appends to the file of the run it continues.)
     export_fp = "{}.csv".format(cmd_args.args_file)
-    if cmd_args.export:
+    if cmd_args.export and not (cmd_args.resume and os.path.isfile(export_fp)):
         with open(export_fp, 'w') as fp:
             writer = csv.writer(fp, delimiter=',')
             writer.writerow(['run', 'best fitness'])
 
+    # Start one persistent pool of worker processes for the parallel
+    # offspring pipeline and the k-means initializer, if they need it. With
+    # --jobs, the pool does whole runs instead.
+    workers = args.get('workers', max(1, mp.cpu_count() // 2))
+    parallel_kmeans = args['initialize_method'] == 'kmeans' and workers > 1 and not islands
+    if jobs > 1:
+        args['worker_pool'] = parallel.WorkerPool(args, jobs)
+    elif args.get('parallel_offspring', False) or parallel_kmeans:
+        args['worker_pool'] = parallel.WorkerPool(args, workers)
+
+    # Every run gets its own seed, spawned from 'seed'
+    entropy, seeds = runner.run_seeds(args, cmd_args.test_runs)
+    print("Seed: %d" % entropy)
+
+    # Continue from the checkpoint, if we are resuming a run
+    checkpoint_fp = checkpoint.checkpoint_path(args, cmd_args.args_file)
+    first_run, first_gen = 0, 0
+    if cmd_args.resume:
+        first_run, first_gen = checkpoint.load_checkpoint(args, checkpoint_fp)
+        print("Resuming run %d at generation %d" % (first_run, first_gen))
+
+    # Record the statistics of every generation, and print a sample of them
+    metrics = telemetry.Telemetry(args, cmd_args.quiet, append=cmd_args.resume)
+
+    # Write checkpoints, and stop cleanly on SIGINT and SIGTERM if
+    # checkpointing is enabled (the handlers are restored at the end)
+    checkpointer = checkpoint.Checkpointer(args, checkpoint_fp)
+    if (checkpointer.enabled or cmd_args.resume) and not islands and jobs == 1:
+        checkpointer.install_signal_handlers()
+
     ##########################################################################
     # MAIN LOOP
     ##########################################################################
-    # Run the algorithm for the specified number of runs
-    for run_num in range(cmd_args.test_runs):
-
-        # Reinitialize population and fitness on a per-run basis
-        initialize.gen_population(args)
-        evaluate.eval_population(args)
-
-        # Run each run for the specified number of generations
-        for i in range(args['generations']):
-            args['current_gen'] = i
-            print("Generation %d: " % i, end="")
-            select.parents(args)
-            offspring_generation.recombination(args)
-            offspring_generation.mutation(args)
-            evaluate.eval_offspring(args)
-            select.survivors(args)
-            evaluate.print_stats(args)
-
-            # Plot the current generation
-            if cmd_args.visualize:
-                evaluate.plot(args)
-
-        evaluate.print_final(args, export_fp, run_num, cmd_args.export)
+    try:
+        # Do the independent runs concurrently on the worker pool, and
+        # report them in run order
+        if jobs > 1:
+            tasks = [(run_num, seeds[run_num]) for run_num in range(cmd_args.test_runs)]
+            for run_num, fitness, tour, seconds in args['worker_pool'].map(runner.run_task, tasks):
+                print("Run %d finished in %.2f s" % (run_num, seconds))
+                evaluate.print_result(fitness, tour, export_fp, run_num, cmd_args.export)
+        else:
+            # Otherwise, run the algorithm for the specified number of runs
+            for run_num in range(first_run, cmd_args.test_runs):
+
+                # Evolve the islands, and continue with the best one
+                if islands:
+                    runner.seed_run(args, seeds[run_num])
+                    island.run_islands(args, cmd_args.quiet)
+                    evaluate.print_final(args, export_fp, run_num, cmd_args.export)
+                    continue
+
+                # Reinitialize population and fitness on a per-run basis, unless
+                # the population of this run was restored from the checkpoint
+                start_gen = 0
+                if cmd_args.resume and run_num == first_run:
+                    start_gen = first_gen
+                else:
+                    runner.seed_run(args, seeds[run_num])
+                    with stage(args, 'initial_population'):
+                        initialize.gen_population(args)
+                    with stage(args, 'initial_evaluation'):
+                        evaluate.eval_population(args)
+
+                # Run each run for the specified number of generations
+                runner.evolve(args, run_num, start_gen, checkpointer, metrics, cmd_args.visualize)
+
+                evaluate.print_final(args, export_fp, run_num, cmd_args.export)
+
+    finally:
+        checkpointer.restore_signal_handlers()
+        metrics.close()
+        if args.get('worker_pool') is not None:
+            args.pop('worker_pool').close()
+        if args.get('profiler') is not None:
+            args.pop('profiler').report()
+        if args.get('memory_tracker') is not None:
+            args.pop('memory_tracker').report(args.get('population'))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+import json
+import os
+import signal
+import time
+
+import numpy as np
+
+from . import data_import, parallel
+from .population import Population, offspring_count
+from .utility import die
+
+# Version of the checkpoint layout, checked when resuming
+CHECKPOINT_VERSION = 3
+
+# The parameters a run can only be resumed with if they are unchanged: the
+# instance, the population sizes and the operator settings
+CHECKPOINT_PARAMETERS = (
+    'datafile', 'distance_dtype', 'pop_size', 'mp_size',
+    'parent_selection', 'tournament_size', 'tournament_replacement', 'selection_pressure',
+    'truncation_ratio', 'recombination', 'crossover_rate', 'box_cutting_points_n',
+    'mutation', 'mutation_rate', 'kca_k', 'candidate_k', 'local_search', 'survivor_dedup',
+)
+
+
+def checkpoint_path(args, args_file):
+    """
+    Get the path of the checkpoint file
+
+    :param args: The global parameter dictionary
+    :param args_file: The JSON file with the parameters
+    :return: 'checkpoint_file' if it is set, otherwise the args file name
+             with '.checkpoint.npz' appended
+    """
+    return args.get('checkpoint_file', "{}.checkpoint.npz".format(args_file))
+
+
+def save_checkpoint(args, path, run_num, generation):
+    """
+    Atomically write the state of a run to a checkpoint file
+
+    :param args: The global parameter dictionary
+    :param path: The path of the checkpoint file
+    :param run_num: The number of the current run
+    :param generation: The number of the next generation to run
+    """
+    population = args['population']
+
+    data_import.save_cache(path, {
+        'version': np.array(CHECKPOINT_VERSION),
+        'datafile_digest': np.array(data_import.datafile_digest(args)),
+        'parameters': np.array(json.dumps(parallel.worker_parameters(args), sort_keys=True)),
+        'run_num': np.array(run_num),
+        'generation': np.array(generation),
+        'tours': population.tours,
+        'fitness': population.fitness,
+        'rng_state': np.array(json.dumps(args['rng'].bit_generator.state)),
+        'seed_sequence': np.array(json.dumps(seed_sequence_state(args['rng']))),
+    })
+
+
+def seed_sequence_state(rng):
+    """
+    Get the state of the SeedSequence a generator spawns its streams from
+
+    :param rng: The random number generator
+    :return: The arguments to recreate the SeedSequence
+    """
+    seed_sequence = rng.bit_generator.seed_seq
+
+    return {
+        'entropy': seed_sequence.entropy,
+        'spawn_key': list(seed_sequence.spawn_key),
+        'pool_size': seed_sequence.pool_size,
+        'n_children_spawned': seed_sequence.n_children_spawned,
+    }
+
+
+def load_checkpoint(args, path):
+    """
+    Restore the state of a run from a checkpoint file
+
+    The population and the random number generator are restored; the other
+    parameters are taken from the current args file, so e.g. 'generations'
+    can be raised to let a finished run go on. The CHECKPOINT_PARAMETERS
+    must be the same as when the checkpoint was written.
+
+    :param args: The global parameter dictionary
+    :param path: The path of the checkpoint file
+    :return: The number of the run, and the number of the next generation;
+             sets the 'population' and 'rng'
+    """
+    if not os.path.isfile(path):
+        die("Checkpoint {} does not exist.".format(path))
+
+    with np.load(path) as checkpoint:
+        if int(checkpoint['version']) != CHECKPOINT_VERSION:
+            die("Checkpoint {} has an unsupported version.".format(path))
+        if str(checkpoint['datafile_digest']) != data_import.datafile_digest(args):
+            die("Checkpoint {} was written for a different data file.".format(path))
+
+        stored = json.loads(str(checkpoint['parameters']))
+        current = parallel.worker_parameters(args)
+        changed = [k for k in CHECKPOINT_PARAMETERS if stored.get(k) != current.get(k)]
+        if changed:
+            die("Checkpoint {} was written with different parameters: {}".format(
+                path, ", ".join("{} ({!r}, now {!r})".format(k, stored.get(k), current.get(k)) for k in changed)))
+
+        tours = checkpoint['tours']
+        if tours.shape != (args['pop_size'], len(args['coordinates'])):
+            die("Checkpoint {} does not match 'pop_size'.".format(path))
+
+        population = Population(args['pop_size'], offspring_count(args['mp_size']), tours.shape[1])
+        population.tours[:] = tours
+        population.fitness[:] = checkpoint['fitness']
+        args['population'] = population
+
+        # The seed sequence carries the count of streams spawned so far,
+        # so the streams spawned after resuming are the same as well
+        rng_state = json.loads(str(checkpoint['rng_state']))
+        rng = np.random.default_rng(np.random.SeedSequence(**json.loads(str(checkpoint['seed_sequence']))))
+        if rng_state['bit_generator'] != rng.bit_generator.state['bit_generator']:
+            die("Checkpoint {} was written with a different random number generator.".format(path))
+        rng.bit_generator.state = rng_state
+        args['rng'] = rng
+
+        return int(checkpoint['run_num']), int(checkpoint['generation'])
+
+
+class Checkpointer(object):
+    """
+    Writes checkpoints every 'checkpoint_interval' generations and/or every
+    'checkpoint_seconds' seconds.
+
+    Checkpointing is enabled if either of them, or 'checkpoint_file', is
+    set. Once its signal handlers are installed, SIGINT and SIGTERM stop the
+    run after the current generation, with a final checkpoint; a second
+    signal aborts right away.
+    """
+
+    def __init__(self, args, path):
+        """
+        Set up the checkpoints
+
+        :param args: The global parameter dictionary
+        :param path: The path of the checkpoint file
+        """
+        self.path = path
+        self.interval = args.get('checkpoint_interval', 0)
+        self.seconds = args.get('checkpoint_seconds')
+        self.enabled = bool(self.interval) or self.seconds is not None or 'checkpoint_file' in args
+        self.last_save = time.time()
+        self.stop_requested = False
+        self.previous_handlers = {}
+
+    def install_signal_handlers(self):
+        """ Stop cleanly on SIGINT and SIGTERM """
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.previous_handlers[signum] = signal.signal(signum, self.handle_signal)
+
+    def restore_signal_handlers(self):
+        """ Put back the signal handlers from before install_signal_handlers """
+        for signum, handler in self.previous_handlers.items():
+            signal.signal(signum, handler)
+        self.previous_handlers = {}
+
+    def handle_signal(self, signum, frame):
+        if self.stop_requested:
+            raise KeyboardInterrupt
+        self.stop_requested = True
+        print("\nStopping after this generation (signal again to abort)...")
+
+    def after_generation(self, args, run_num, generation):
+        """
+        Write a checkpoint if one is due, and stop the run if a signal came in
+
+        :param args: The global parameter dictionary
+        :param run_num: The number of the current run
+        :param generation: The number of the generation that just finished
+        """
+        due = self.stop_requested
+        if self.interval and (generation + 1) % self.interval == 0:
+            due = True
+        if self.seconds is not None and time.time() - self.last_save >= self.seconds:
+            due = True
+
+        if due:
+            save_checkpoint(args, self.path, run_num, generation + 1)
+            self.last_save = time.time()
+
+        if self.stop_requested:
+            population = args['population']
+            best = population.best_index()
+            print("Checkpoint written to {} (run {}, generation {}).".format(
+                self.path, run_num, generation + 1))
+            print("The best individual so far: ")
+            print("#%d (fitness: %d): %s" % (0, -population.fitness[best], population.tours[best].tolist()))
+            raise SystemExit(1)
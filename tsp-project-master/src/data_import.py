@@ -1,6 +1,23 @@
-import math
+import glob
+import hashlib
+import os
 import os.path
-import pickle
+import time
+
+import numpy as np
+
+from .distance import LazyDistanceMatrix
+from .spatial import GridIndex
+from .utility import die
+
+# Upper bound on the number of temporary elements held at once while
+# building the distance matrix, so that large instances are computed in
+# row blocks instead of one enormous broadcast.
+DISTANCE_BLOCK_ELEMENTS = 1 << 22
+
+# Version of the on-disk cache layout. Bump this whenever the contents of a
+# cache file change meaning, so that old files are rebuilt instead of reused.
+CACHE_VERSION = 1
 
 
 def parse_datafile(args):
@@ -8,7 +25,7 @@ def parse_datafile(args):
     Parse the TSP data file
 
     :param args: The global parameter dictionary
-    :return: Adds the 'dataset' to the dictionary
+    :return: Adds the 'dataset' and 'coordinates' to the dictionary
     """
 
     datafile = args['datafile']
@@ -26,39 +43,249 @@ def parse_datafile(args):
             dataset[int(elements[0]) - 1] = (float(elements[1]), float(elements[2]))
 
     args['dataset'] = dataset
+    args['coordinates'] = dataset_to_coordinates(dataset)
+
+
+def dataset_to_coordinates(dataset):
+    """
+    Convert the dataset dictionary to a coordinate array
+
+    :param dataset: A dictionary mapping each city to its (x, y) tuple
+    :return: An N x 2 array, where row i holds the coordinates of city i
+    """
+    coordinates = np.empty((len(dataset), 2), dtype=np.float64)
+    for city, (x, y) in dataset.items():
+        coordinates[city] = x, y
+
+    return coordinates
+
+
+def build_distance_matrix(coordinates, dtype=np.float64):
+    """
+    Calculate the Euclidean distance between every pair of cities
+
+    The matrix is computed in blocks of rows, each block with one batched
+    NumPy expression, so the temporary memory stays bounded no matter how
+    many cities there are.
+
+    :param coordinates: An N x 2 array of city coordinates
+    :param dtype: The data type of the resulting matrix (float64 or float32)
+    :return: An N x N array of distances
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    number_of_cities = len(coordinates)
+    distance_matrix = np.empty((number_of_cities, number_of_cities), dtype=dtype)
+
+    block_rows = max(1, DISTANCE_BLOCK_ELEMENTS // max(1, number_of_cities))
+    for start in range(0, number_of_cities, block_rows):
+        end = min(start + block_rows, number_of_cities)
+        delta = coordinates[start:end, np.newaxis, :] - coordinates[np.newaxis, :, :]
+        distance_matrix[start:end] = np.sqrt(np.einsum('ijk,ijk->ij', delta, delta))
+
+    return distance_matrix
+
+
+def datafile_digest(args):
+    """
+    Hash the contents of the TSP data file
+
+    :param args: The global parameter dictionary
+    :return: A short hex digest of the data file, also stored as 'datafile_digest'
+    """
+    if 'datafile_digest' not in args:
+        digest = hashlib.sha1()
+        with open(args['datafile'], 'rb') as datafile:
+            for chunk in iter(lambda: datafile.read(1 << 20), b''):
+                digest.update(chunk)
+        args['datafile_digest'] = digest.hexdigest()[:16]
+
+    return args['datafile_digest']
+
+
+def cache_path(args, kind, extension=".npy"):
+    """
+    Get the path of a cache file stored next to the data file
+
+    The name contains the cache version and the digest of the data file, so
+    an edited data set or a new cache layout never matches an old file.
+
+    :param args: The global parameter dictionary
+    :param kind: What is cached, e.g. 'distance-float64'
+    :param extension: The file extension
+    :return: The path of the cache file
+    """
+    return "{}.{}-v{}-{}{}".format(args['datafile'], kind, CACHE_VERSION,
+                                   datafile_digest(args), extension)
+
+
+def remove_stale_caches(args, kind, extension=".npy"):
+    """
+    Remove cache files of the given kind that no longer match the data file
+
+    :param args: The global parameter dictionary
+    :param kind: What is cached, e.g. 'distance-float64'
+    :param extension: The file extension
+    """
+    current = cache_path(args, kind, extension)
+    for path in glob.glob(glob.escape(args['datafile']) + "." + kind + "-v*" + extension):
+        if path != current:
+            os.remove(path)
+
+
+def save_cache(path, array):
+    """
+    Atomically write an array to a .npy cache file, or a dictionary of
+    arrays to a .npz cache file
+
+    :param path: The path of the cache file
+    :param array: The array (or dictionary of arrays) to store
+    """
+    temporary_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary_path, 'wb') as f:
+        if isinstance(array, dict):
+            np.savez(f, **array)
+        else:
+            np.save(f, array)
+    os.replace(temporary_path, path)
+
+
+def load_cache(path, shape, dtype):
+    """
+    Memory-map a .npy cache file, if it exists and has the expected layout
+
+    :param path: The path of the cache file
+    :param shape: The expected shape of the array
+    :param dtype: The expected data type of the array
+    :return: A read-only memory-mapped array, or None if the cache is unusable
+    """
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        array = np.load(path, mmap_mode='r')
+    except (ValueError, OSError):
+        return None
+
+    if array.shape != tuple(shape) or array.dtype != dtype:
+        return None
+
+    return array
 
 
 def calc_distance_matrix(args):
     """
     Calculate the distance matrix
 
+    If the dense matrix would not fit in 'distance_memory_budget_mb', a
+    LazyDistanceMatrix that computes distances on demand is used instead.
+
     :param args: The global parameter dictionary
     :return: Adds the 'distance_matrix' to the dictionary
     """
 
-    dataset = args['dataset']
     datafile = args['datafile']
+    dtype = np.dtype(args.get('distance_dtype', 'float64'))
+    if dtype not in (np.float64, np.float32):
+        die("distance_dtype must be float64 or float32")
+
+    number_of_cities = len(args['coordinates'])
+    matrix_bytes = number_of_cities ** 2 * dtype.itemsize
+    budget_bytes = args.get('distance_memory_budget_mb', 4096) * 2 ** 20
 
-    # Load the distance matrix from a file if it exists
-    if os.path.isfile(datafile + ".distance"):
-        with open(datafile + ".distance", "rb") as myfile:
-            distance_matrix = pickle.load(myfile)
+    # Too large for a dense matrix, so compute distances on demand
+    if matrix_bytes > budget_bytes:
+        args['distance_matrix'] = LazyDistanceMatrix(
+            args['coordinates'], dtype, args.get('distance_cache_rows', 1024))
+        print("Distance matrix computed on demand: %dx%d %s would need %.1f MB "
+              "(budget: %.1f MB)" % (number_of_cities, number_of_cities, dtype,
+                                     matrix_bytes / 2 ** 20, budget_bytes / 2 ** 20))
+        return
+
+    kind = "distance-" + dtype.name
+    path = cache_path(args, kind)
+
+    start = time.perf_counter()
+
+    # Memory-map the distance matrix from the cache file if it exists. The
+    # pages are loaded on demand and shared between all processes reading
+    # the same file.
+    distance_matrix = load_cache(path, (number_of_cities, number_of_cities), dtype)
+    source = "mapped"
 
     # Otherwise, create the distance matrix and write it to a file
     # for easy parsing on subsequent runs.
-    else:
-        all_cities = range(len(dataset))
-        distance_matrix = [[0 for city1 in all_cities] for city2 in all_cities]
+    if distance_matrix is None:
+        distance_matrix = build_distance_matrix(args['coordinates'], dtype)
+        source = "built"
 
-        # Assign each value to the distance matrix
-        for city1 in all_cities:
-            for city2 in all_cities:
-                distance_matrix[city1][city2] = math.sqrt((dataset[city1][0] - dataset[city2][0]) ** 2 + (
-                        dataset[city1][1] - dataset[city2][1]) ** 2)
+        # Remove caches of older versions of the data file, as well as the
+        # pickled matrix used before the binary cache format existed.
+        remove_stale_caches(args, kind)
+        if os.path.isfile(datafile + ".distance"):
+            os.remove(datafile + ".distance")
 
         # Write the distance matrix to a file
-        f = open(datafile + ".distance", "wb")
-        pickle.dump(distance_matrix, f)
-        f.close()
+        save_cache(path, distance_matrix)
+
+    took = (time.perf_counter() - start) * 1000.0
+    print("Distance matrix %s: %dx%d %s (%.1f MB) in %.2f ms" % (
+        source, distance_matrix.shape[0], distance_matrix.shape[1],
+        distance_matrix.dtype, distance_matrix.nbytes / 2 ** 20, took))
 
     args['distance_matrix'] = distance_matrix
+
+
+def calc_spatial_index(args):
+    """
+    Build the spatial index over the city coordinates
+
+    The index is small (O(N)), but it is still cached next to the data file
+    like the distance matrix.
+
+    :param args: The global parameter dictionary
+    :return: Adds the 'spatial_index' to the dictionary
+    """
+    kind = "grid"
+    path = cache_path(args, kind, ".npz")
+
+    spatial_index = None
+    if os.path.isfile(path):
+        try:
+            with np.load(path) as archive:
+                spatial_index = GridIndex.from_arrays(args['coordinates'], archive)
+        except (ValueError, OSError, KeyError):
+            spatial_index = None
+
+    if spatial_index is None:
+        spatial_index = GridIndex(args['coordinates'])
+        remove_stale_caches(args, kind, ".npz")
+        save_cache(path, spatial_index.arrays())
+
+    args['spatial_index'] = spatial_index
+
+
+def calc_neighbours(args):
+    """
+    Find the candidate neighbours of every city: its 'candidate_k' nearest
+    other cities, nearest first
+
+    :param args: The global parameter dictionary
+    :return: Adds the 'neighbours' (an N x k array of city indices) to the dictionary
+    """
+    number_of_cities = len(args['coordinates'])
+    candidate_k = args.get('candidate_k', 8)
+    if candidate_k < 1:
+        die("candidate_k must be at least 1")
+    candidate_k = min(candidate_k, number_of_cities - 1)
+
+    kind = "neighbours-k%d" % candidate_k
+    path = cache_path(args, kind)
+
+    neighbours = load_cache(path, (number_of_cities, candidate_k), np.int32)
+    if neighbours is None:
+        cities = np.arange(number_of_cities)
+        neighbours = args['spatial_index'].nearest_cities(cities, candidate_k)[0].astype(np.int32)
+        remove_stale_caches(args, kind)
+        save_cache(path, neighbours)
+
+    args['neighbours'] = neighbours
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LazyDistanceMatrix(object):
+    """
+    Matrix-free stand-in for the N x N distance matrix.
+
+    Distances are computed on demand from the city coordinates, so memory
+    use is O(N) instead of O(N^2). It supports the same indexing as a 2-D
+    ndarray: distance_matrix[city] returns a row, distance_matrix[city1][city2]
+    and distance_matrix[city1, city2] return a distance, and
+    distance_matrix[cities1, cities2] with integer arrays returns the
+    element-wise distances in one batched computation.
+    """
+
+    def __init__(self, coordinates, dtype=np.float64, cache_rows=1024):
+        """
+        Set up the distance provider
+
+        :param coordinates: An N x 2 array of city coordinates
+        :param dtype: The data type of the returned distances
+        :param cache_rows: How many recently used rows to keep in memory
+        """
+        self.coordinates = np.ascontiguousarray(coordinates, dtype=np.float64)
+        self.dtype = np.dtype(dtype)
+        self.shape = (len(self.coordinates), len(self.coordinates))
+        self.ndim = 2
+        self.cache_rows = max(0, int(cache_rows))
+        self._rows = OrderedDict()
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self):
+        """ The memory held by the cached rows """
+        return len(self._rows) * self.shape[1] * self.dtype.itemsize
+
+    def row(self, city):
+        """
+        Get the distances from a city to every other city
+
+        Rows are kept in a bounded least-recently-used cache, because the
+        same cities tend to be looked up again and again.
+
+        :param city: The index of the city
+        :return: A read-only array of N distances
+        """
+        row = self._rows.get(city)
+        if row is not None:
+            self._rows.move_to_end(city)
+            return row
+
+        row = self.pairwise(city, slice(None))
+        row.flags.writeable = False
+
+        if self.cache_rows:
+            self._rows[city] = row
+            if len(self._rows) > self.cache_rows:
+                self._rows.popitem(last=False)
+
+        return row
+
+    def pairwise(self, cities1, cities2):
+        """
+        Calculate the element-wise distances between two sets of cities
+
+        :param cities1: A city index, or an array of them
+        :param cities2: A city index, or an array of them (broadcast against cities1)
+        :return: The distances, with the broadcast shape of the inputs
+        """
+        delta = self.coordinates[cities1] - self.coordinates[cities2]
+        distances = np.sqrt(np.einsum('...k,...k->...', delta, delta))
+
+        return distances.astype(self.dtype, copy=False)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            if len(key) != 2:
+                raise IndexError("too many indices for a distance matrix")
+            distances = self.pairwise(key[0], key[1])
+            return distances[()] if distances.ndim == 0 else distances
+
+        if np.ndim(key) == 0 and not isinstance(key, slice):
+            return self.row(int(key))
+
+        cities = np.arange(len(self))[key]
+        return np.stack([self.row(city) for city in cities.ravel()]).reshape(
+            cities.shape + (len(self),))
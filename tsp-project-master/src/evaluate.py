@@ -5,59 +5,86 @@ import matplotlib.pyplot as plt
 from .utility import *
 
 
-def eval_population(args):
-    """
-    Evaluates a population's fitness
+# Upper bound on the number of edges gathered at once when evaluating a
+# population, so that memory stays bounded for large populations.
+EVAL_CHUNK_ELEMENTS = 1 << 20
 
-    :param args: The global parameter dictionary
-    :return: Adds 'fitness' to the dictionary
-    """
 
-    population = args['population']
-    distance_matrix = args['distance_matrix']
+def tour_lengths(tours, distance_matrix, chunk_size=None):
+    """
+    Calculate the length of every tour in a population
 
-    fitness = []
+    Every tour's edges are the pairs (tour, roll(tour)), including the edge
+    from the last city back to the first, and their distances are gathered
+    from the matrix in one batched lookup per chunk of tours.
 
-    # For every individual in the population
-    for individual_idx in range(len(population)):
+    :param tours: A 2-D integer array (or list of lists), one tour per row
+    :param distance_matrix: The distance matrix
+    :param chunk_size: How many tours to evaluate at once (default: bounded by EVAL_CHUNK_ELEMENTS)
+    :return: An array of tour lengths
+    """
+    tours = np.asarray(tours)
+    if tours.dtype.kind not in 'iu':
+        tours = tours.astype(np.intp)
+    if tours.ndim == 1:
+        tours = tours[np.newaxis, :]
 
-        individual_sum = 0
+    if chunk_size is None:
+        chunk_size = max(1, EVAL_CHUNK_ELEMENTS // max(1, tours.shape[1]))
 
-        # Point at the individual
-        individual = population[individual_idx]
+    lengths = np.empty(len(tours), dtype=np.float64)
+    for start in range(0, len(tours), chunk_size):
+        chunk = tours[start:start + chunk_size]
+        edges = distance_matrix[chunk, np.roll(chunk, -1, axis=1)]
+        lengths[start:start + chunk_size] = edges.sum(axis=1, dtype=np.float64)
 
-        # Look at every city pair
-        for allele_idx in range(len(individual) - 1):
-            city1 = individual[allele_idx]
-            city2 = individual[allele_idx + 1]
+    return lengths
 
-            # Add their distance to the total
-            individual_sum += distance_matrix[city1][city2]
 
-        # Add the distance from the last node, back to the starting node
-        individual_sum += distance_matrix[individual[0]][individual[-1]]
+def eval_population(args):
+    """
+    Evaluates a population's fitness
 
-        # Add this individual's sum to the list of fitnesses, as a negative
-        # value, so that we view this as a maximization problem
-        fitness.append(-individual_sum)
+    :param args: The global parameter dictionary
+    :return: Fills in the population's fitness
+    """
+    population = args['population']
 
-    args['fitness'] = fitness
+    # Store the fitnesses as negative values, so that we view this as a
+    # maximization problem
+    population.fitness[:] = -tour_lengths(population.tours, args['distance_matrix'])
 
 
-def print_stats(args):
+def calc_stats(args):
     """
-    Print statistics about a current generation
+    Calculate statistics about a current generation
 
-    :param args:
-    :param export:
-    :param export_fp:
-    :return:
+    :param args: The global parameter dictionary
+    :return: Adds 'max', 'mean' and 'sd' to the dictionary
     """
-    fitness = args['fitness']
+    fitness = args['population'].fitness
     args['max'] = -np.max(fitness)
     args['mean'] = -np.mean(fitness)
     args['sd'] = np.std(fitness)
-    print("Max: %d\tMean: %d\tSD: %d" % (args['max'], args['mean'], args['sd']))
+
+
+def format_stats(args):
+    """
+    Calculate and format statistics about a current generation
+
+    :param args: The global parameter dictionary
+    :return: The statistics as a single line; adds 'max', 'mean' and 'sd' to the dictionary
+    """
+    calc_stats(args)
+    stats = "Max: %d\tMean: %d\tSD: %d" % (args['max'], args['mean'], args['sd'])
+    if 'duplicates_dropped' in args:
+        stats += "\tDuplicates dropped: %d" % args['duplicates_dropped']
+    if 'ls_moves' in args:
+        stats += "\tLocal search: %d moves, %d gain, %.1f ms" % (
+            args['ls_moves'], args['ls_gain'], args['ls_ms'])
+
+    return stats
+
 
 def plot(args):
     """
@@ -78,15 +105,9 @@ def print_final(args, export_fp, run_num, export=False):
     :param export: A boolean value, which indicates whether or not the statistics are to be exported to a file.
     :return:
     """
-    distribution = rankify(args['fitness'])
-    print("The best individual: ")
-    print("#%d (fitness: %d): %s" % (0, -args['fitness'][distribution[0]], args['population'][distribution[0]]))
-
-    # Write the the output to a CSV file, if specified.
-    if export:
-        with open(export_fp, 'a') as csvfile:
-            writer = csv.writer(csvfile, delimiter=',')
-            writer.writerow([run_num, -args['fitness'][distribution[0]]])
+    population = args['population']
+    best = population.best_index()
+    print_result(population.fitness[best], population.tours[best], export_fp, run_num, export)
 
     # We need to halt the program so that the user can examine the plots
     if args.get('plotter') is not None:
@@ -96,22 +117,58 @@ def print_final(args, export_fp, run_num, export=False):
             print("\nExiting...")
 
 
+def print_result(fitness, tour, export_fp, run_num, export=False):
+    """
+    Print the best individual of a run, and export its fitness
+
+    :param fitness: The fitness of the best individual
+    :param tour: The tour of the best individual
+    :param export_fp: The CSV file to export to
+    :param run_num: The number of the run
+    :param export: A boolean value, which indicates whether or not the statistics are to be exported to a file.
+    """
+    print("The best individual: ")
+    print("#%d (fitness: %d): %s" % (0, -fitness, tour.tolist()))
+
+    # Write the the output to a CSV file, if specified.
+    if export:
+        with open(export_fp, 'a') as csvfile:
+            writer = csv.writer(csvfile, delimiter=',')
+            writer.writerow([run_num, -fitness])
+
+
 def eval_offspring(args):
-    population = args['offspring']
-    distance_matrix = args['distance_matrix']
+    """
+    Evaluates the offspring's fitness
 
-    fitness = []
+    Only offspring flagged in the population's 'offspring_dirty' are
+    evaluated; the others already carry an up-to-date fitness.
 
-    for individual_idx in range(len(population)):
+    :param args: The global parameter dictionary
+    :return: Fills in the fitness of the population's offspring
+    """
+    population = args['population']
 
-        individual_sum = 0
+    dirty = np.flatnonzero(population.offspring_dirty)
+    if dirty.size:
+        lengths = tour_lengths(population.offspring[dirty], args['distance_matrix'])
+        population.offspring_fitness[dirty] = -lengths
+        population.offspring_dirty[:] = False
 
-        for allele_idx in range(len(population[individual_idx]) - 1):
-            city1 = population[individual_idx][allele_idx]
-            city2 = population[individual_idx][allele_idx + 1]
-            individual_sum += distance_matrix[city1][city2]
-        individual_sum += distance_matrix[population[individual_idx][0]][population[individual_idx][-1]]
 
-        fitness.append(-individual_sum)
+def edge_delta(distance_matrix, removed, added):
+    """
+    Calculate the change in tour length caused by replacing some edges
+
+    :param distance_matrix: The distance matrix
+    :param removed: The (city1, city2) edges taken out of the tour
+    :param added: The (city1, city2) edges put into the tour
+    :return: The length of the added edges minus the length of the removed edges
+    """
+    delta = 0.0
+    for city1, city2 in added:
+        delta += distance_matrix[city1, city2]
+    for city1, city2 in removed:
+        delta -= distance_matrix[city1, city2]
 
-    args['offspring_fitness'] = fitness
+    return delta
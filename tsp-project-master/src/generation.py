@@ -0,0 +1,45 @@
+from . import evaluate, local_search, offspring_generation, select
+from .telemetry import stage
+
+
+def breed(args):
+    """
+    Breed the offspring of the mating pool, mutate them, improve them with
+    local search (if 'local_search' is set) and evaluate them
+
+    :param args: The global parameter dictionary
+    :return: Fills in the population's offspring and their fitness
+    """
+    with stage(args, 'recombination'):
+        offspring_generation.recombination(args)
+    with stage(args, 'mutation'):
+        offspring_generation.mutation(args)
+    if args.get('local_search'):
+        with stage(args, 'local_search'):
+            local_search.improve_offspring(args)
+    with stage(args, 'evaluation'):
+        evaluate.eval_offspring(args)
+
+
+def next_generation(args):
+    """
+    Run one generation of the EA
+
+    Every stage is timed, see telemetry.stage.
+
+    :param args: The global parameter dictionary
+    :return: Replaces the parents of the population with the survivors
+    """
+    with stage(args, 'parent_selection'):
+        select.parents(args)
+
+    # Breed on the worker pool, if the parallel offspring pipeline is on
+    worker_pool = args.get('worker_pool')
+    if worker_pool is not None and args.get('parallel_offspring', False):
+        with stage(args, 'breeding'):
+            worker_pool.breed(args)
+    else:
+        breed(args)
+
+    with stage(args, 'survivor_selection'):
+        select.survivors(args)
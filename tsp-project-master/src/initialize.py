@@ -1,9 +1,21 @@
-import multiprocessing as mp
 import time
 
 import numpy as np
 
+from src import parallel
 from src.plotter import PlotHelper
+from src.population import Population, offspring_count
+from src.spatial import GridIndex
+from src.utility import die
+
+INITIALIZE_METHODS = ('random', 'kmeans', 'nearest_neighbour', 'greedy', 'space_filling_curve')
+
+# The number of grid cells along each side of the Hilbert curve
+HILBERT_ORDER_SIZE = 1 << 16
+
+# Upper bound on the number of distances looked up at once by the k-means
+# initializer.
+KMEANS_BLOCK_ELEMENTS = 1 << 20
 
 
 def gen_population(args):
@@ -13,47 +25,68 @@ def gen_population(args):
     :param args: The global parameter dictionary.
     """
 
-    chromosome_length = len(args['dataset'])
+    chromosome_length = len(args['coordinates'])
     pop_size = args['pop_size']
     initialize_method = args['initialize_method']
-    pop = []
+    if initialize_method not in INITIALIZE_METHODS:
+        die("initialize_method must be one of: %s" % ", ".join(INITIALIZE_METHODS))
+
+    population = Population(pop_size, offspring_count(args['mp_size']), chromosome_length)
+    pop = population.tours
+    rng = args['rng']
 
     # Initialize the starting population as a randomly sampled set of the
     # permutation space.
     if initialize_method == 'random':
-        for i in range(pop_size):
-            pop.append(list(np.random.permutation(range(chromosome_length))))
+        pop[:] = np.argsort(rng.random((pop_size, chromosome_length)), axis=1)
 
     # Initialize the starting population as a randomly sampled set of the
     # permutation space, in a sequence of concatenated clusters using
     # the k-means algorithm.
     if initialize_method == 'kmeans':
 
-        # Use multiple CPUs in a multiprocessing pool to do the
-        # k-means algorithm in parallel
-        number_of_cpus = mp.cpu_count()//2
-        pool = mp.Pool(number_of_cpus)
+        # Use the persistent worker pool, if there is one, to do the
+        # k-means algorithm in parallel. The workers already have the
+        # instance data, so only the resulting tours are sent back. Every
+        # individual gets its own stream, spawned from 'rng', so the tours
+        # are the same with or without the pool.
+        rngs = rng.spawn(pop_size)
+        worker_pool = args.get('worker_pool')
+        if worker_pool is not None:
+            for i, tour in enumerate(worker_pool.map(kmeans_task, rngs)):
+                pop[i] = tour
+        else:
+            for i, individual_rng in enumerate(rngs):
+                pop[i] = kmeans(dict(args, rng=individual_rng))
+
+    # Initialize the starting population with constructive heuristics, each
+    # randomized so that the individuals differ: nearest-neighbour tours
+    # from random start cities, greedy-edge tours on slightly perturbed edge
+    # lengths, and Hilbert curve orderings of jittered coordinates.
+    if initialize_method == 'nearest_neighbour':
+        for i in range(pop_size):
+            pop[i] = nearest_neighbour(args)
 
-        # Remove the plotter (because of MP)
-        plotter = args.get("plotter")
-        args.pop("plotter", None)
+    if initialize_method == 'greedy':
+        for i in range(pop_size):
+            pop[i] = greedy_edge(args)
 
-        # Collect a list of result objects for each of the individuals that
-        # we would like to generate
-        results = [pool.apply_async(kmeans, args=(args,)) for x in range(pop_size)]
+    if initialize_method == 'space_filling_curve':
+        for i in range(pop_size):
+            pop[i] = space_filling_curve(args)
 
-        # Create the population by iterating over the result objects
-        pop = [p.get() for p in results]
+    # Assign the new population to the dictionary
+    args['population'] = population
 
-        # Wait for the processes to finish before exiting this function
-        pool.close()
-        pool.join()
 
-        # Put the plotter back in
-        args['plotter'] = plotter
+def kmeans_task(rng):
+    """
+    Generate one individual with the k-means algorithm on a worker process.
 
-    # Assign the new population to the dictionary
-    args['population'] = pop
+    :param rng: The individual's random number generator.
+    :return: The tour.
+    """
+    return kmeans(dict(parallel.worker_args(), rng=rng))
 
 
 def kmeans(args):
@@ -61,111 +94,276 @@ def kmeans(args):
     Initialize the population using the k-means algorithm.
 
     :param args: The global parameter dictionary.
+    :return: A tour that visits the cities cluster by cluster.
     """
-    chromosome_length = len(args['dataset'])
+    coordinates = args['coordinates']
+    chromosome_length = len(coordinates)
     distance_matrix = args['distance_matrix']
 
-    # Because of multiprocessing, reseed the RNG
-    np.random.seed()
-
     # Get the number of clusters
     kca_k = args['kca_k']
     # kca_k is a proportion of the chromosome length
-    kca_k = int(kca_k * chromosome_length)
+    kca_k = max(1, int(kca_k * chromosome_length))
 
     # Calculate cluster centers
-    kca_cluster_centers = np.random.choice(range(chromosome_length), kca_k, replace=False)
+    kca_cluster_centers = args['rng'].choice(chromosome_length, kca_k, replace=False)
 
-    # Initialize an empty array of cities that correspond
-    # to the centers
-    kca_cluster_cities = [[] for x in range(kca_k)]
-
-    # Assign every city to a particular cluster
-    for city in range(chromosome_length):
-        # Calculate the distance between a given city and every cluster
-        # center
-        distances = [distance_matrix[x][city] for x in kca_cluster_centers]
-        # Pick the cluster that is closest to the given city
-        min_d = np.argmin(distances)
-        # Then, add the city to that closest cluster
-        kca_cluster_cities[min_d].append(city)
-
-    iteration = 0
+    # Assign every city to the cluster with the closest center
+    kca_clusters = assign_clusters(coordinates, kca_cluster_centers)
 
     # kca_iterations defines for how many iterations the cluster centers
     # are refined. Usually, one would use a convergence a model to find an
     # appropriate stopping condition, but that turned out to be too
     # computationally expensive in our case.
-    while iteration < args['kca_iterations']:
-        iteration += 1
-
-        # For every cluster
-        for cluster_idx in range(len(kca_cluster_cities)):
-            # If the cluster is empty, skip it
-            if len(kca_cluster_cities[cluster_idx]) == 0:
-                continue
-
-            distances = []
-            distance = 0
-
-            # Find a new center for the given cluster if a better one exists
-            # For every city city1 in the cluster, we add all the distances between
-            # city1 and every other city and append it to the 'distances' list.
-            for city_idx in range(len(kca_cluster_cities[cluster_idx])):
-                for city_idx2 in range(len(kca_cluster_cities[cluster_idx])):
-                    if city_idx == city_idx2:
-                        continue
-                    city1 = kca_cluster_cities[cluster_idx][city_idx]
-                    city2 = kca_cluster_cities[cluster_idx][city_idx2]
-                    distance += distance_matrix[city1][city2]
-                distances.append(distance)
-
-            # Pick the city with the smallest cumulative distance
-            # every other city and make it the new center of the current
-            # cluster.
-            low_idx = np.argmin(distances)
-            low_city = kca_cluster_cities[cluster_idx][low_idx]
-            kca_cluster_centers[cluster_idx] = low_city
+    for iteration in range(args['kca_iterations']):
+
+        # Find a new center for every cluster: the city with the smallest
+        # total distance to every other city in the cluster. Empty clusters
+        # keep their center.
+        cities_by_cluster = np.argsort(kca_clusters, kind='stable')
+        bounds = np.searchsorted(kca_clusters[cities_by_cluster], np.arange(kca_k + 1))
+        for cluster_idx in range(kca_k):
+            members = cities_by_cluster[bounds[cluster_idx]:bounds[cluster_idx + 1]]
+            if len(members):
+                kca_cluster_centers[cluster_idx] = medoid(distance_matrix, members)
 
         # Order all the clusters by their centers, so that the closest
         # clusters stay close to each other.
-        new_cluster = [kca_cluster_centers[0]]
+        kca_cluster_centers = order_centers(distance_matrix, kca_cluster_centers)
+
+        # We need to re-assign cities to particular clusters again,
+        # now that we've moved the centers around
+        kca_clusters = assign_clusters(coordinates, kca_cluster_centers)
 
-        while len(new_cluster) < len(kca_cluster_centers):
-            cluster_centers = []
-            cluster_center_distances = []
+    # Convert the clustered 2-D chromosome to a 1-D sequence: the cities of
+    # the first cluster, then the second, and so on.
+    return np.argsort(kca_clusters, kind='stable')
 
-            # For the right-most element of the new_cluster list
-            # let's call it 'nc', calculate the distance
-            # between nc and every other cluster center.
-            for i in kca_cluster_centers:
-                if i in new_cluster:
-                    continue
 
-                cluster_centers.append(i)
-                cluster_center_distances.append(distance_matrix[i][new_cluster[-1]])
+def assign_clusters(coordinates, centers):
+    """
+    Find the closest cluster center of every city.
 
-            # Pick the cluster that is closest to nc.
-            smallest_cluster_idx = np.argmin(cluster_center_distances)
-            # And append it to new_clusters.
-            new_cluster.append(cluster_centers[smallest_cluster_idx])
+    The centers are put in a spatial index, so every city only looks at
+    the centers around it instead of all of them.
 
-        kca_cluster_centers = new_cluster
+    :param coordinates: The coordinates of the cities.
+    :param centers: The city index of every cluster center.
+    :return: The index of the closest center of every city.
+    """
+    nearest, distances = GridIndex(coordinates[centers]).knn(coordinates, 1)
 
-        # We need to re-assign cities to particular clusters again,
-        # now that we've moved the centers around
-        kca_cluster_cities = [[] for x in range(kca_k)]
+    return nearest[:, 0]
+
+
+def medoid(distance_matrix, members):
+    """
+    Find the city of a cluster that is closest to all the others in total.
+
+    :param distance_matrix: The distance matrix.
+    :param members: The cities in the cluster.
+    :return: The medoid city.
+    """
+    totals = np.empty(len(members))
+
+    block = max(1, KMEANS_BLOCK_ELEMENTS // len(members))
+    for start in range(0, len(members), block):
+        rows = members[start:start + block]
+        totals[start:start + block] = distance_matrix[rows[:, np.newaxis], members[np.newaxis, :]].sum(axis=1)
+
+    return members[np.argmin(totals)]
+
+
+def order_centers(distance_matrix, centers):
+    """
+    Order cluster centers greedily: start with the first center, and always
+    continue with the closest center that is not ordered yet.
+
+    :param distance_matrix: The distance matrix.
+    :param centers: The city index of every cluster center.
+    :return: The reordered centers.
+    """
+    ordered = np.empty_like(centers)
+    remaining = np.ones(len(centers), dtype=bool)
 
-        for city in range(chromosome_length):
-            distances = [distance_matrix[x][city] for x in kca_cluster_centers]
-            min_d = np.argmin(distances)
-            kca_cluster_cities[min_d].append(city)
+    current = 0
+    for i in range(len(centers)):
+        ordered[i] = centers[current]
+        remaining[current] = False
+        if i + 1 < len(centers):
+            distances = distance_matrix[centers[current], centers]
+            current = np.argmin(np.where(remaining, distances, np.inf))
 
-    # Convert the clustered 2-D chromosome to a 1-D sequence
-    flattened_array = [kca_cluster_cities[x][y] for x in range(len(kca_cluster_cities)) \
-                       for y in range(len(kca_cluster_cities[x]))]
+    return ordered
 
-    return flattened_array
+
+def nearest_neighbour(args):
+    """
+    Build a tour with the nearest-neighbour heuristic from a random city.
+
+    The next city is the nearest unvisited candidate neighbour of the
+    current city; only if all of them are visited is the whole distance row
+    searched.
+
+    :param args: The global parameter dictionary.
+    :return: The tour.
+    """
+    distance_matrix = args['distance_matrix']
+    neighbours = args['neighbours'].tolist()
+    chromosome_length = len(neighbours)
+
+    tour = np.empty(chromosome_length, dtype=np.intp)
+    visited = np.zeros(chromosome_length, dtype=bool)
+
+    current = args['rng'].integers(chromosome_length)
+    for i in range(chromosome_length):
+        tour[i] = current
+        visited[current] = True
+        if i == chromosome_length - 1:
+            break
+
+        for city in neighbours[current]:
+            if not visited[city]:
+                current = city
+                break
+        else:
+            current = np.argmin(np.where(visited, np.inf, distance_matrix[current]))
+
+    return tour
+
+
+def greedy_edge(args):
+    """
+    Build a tour with the greedy edge heuristic.
+
+    The candidate edges (every city to its candidate neighbours) are taken
+    shortest first, as long as both cities have fewer than two edges and the
+    edge does not close a cycle. The resulting paths are then joined, each
+    time to the nearest free end. The edge lengths are multiplied by a
+    random factor of up to 1 + 'greedy_noise', so every tour is different.
+
+    :param args: The global parameter dictionary.
+    :return: The tour.
+    """
+    distance_matrix = args['distance_matrix']
+    neighbours = args['neighbours']
+    chromosome_length = len(neighbours)
+    if chromosome_length < 3:
+        return np.arange(chromosome_length)
+
+    cities = np.repeat(np.arange(chromosome_length), neighbours.shape[1])
+    others = neighbours.ravel()
+    lengths = np.asarray(distance_matrix[cities, others], dtype=np.float64)
+    lengths *= 1 + args.get('greedy_noise', 0.1) * args['rng'].random(len(lengths))
+    order = np.argsort(lengths, kind='stable')
+
+    # The two tour neighbours of every city (-1 while unknown), and a
+    # union-find forest of the paths built so far
+    links = [[-1, -1] for city in range(chromosome_length)]
+    degree = [0] * chromosome_length
+    parent = list(range(chromosome_length))
+
+    def root(city):
+        while parent[city] != city:
+            parent[city] = parent[parent[city]]
+            city = parent[city]
+        return city
+
+    def link(city1, city2):
+        links[city1][degree[city1]] = city2
+        links[city2][degree[city2]] = city1
+        degree[city1] += 1
+        degree[city2] += 1
+        parent[root(city1)] = root(city2)
+
+    edges = 0
+    for city1, city2 in zip(cities[order].tolist(), others[order].tolist()):
+        if degree[city1] < 2 and degree[city2] < 2 and root(city1) != root(city2):
+            link(city1, city2)
+            edges += 1
+            if edges == chromosome_length - 1:
+                break
+
+    # Walk along the paths, and join them: from the end of a path, continue
+    # with the nearest free end of another path
+    tour = np.empty(chromosome_length, dtype=np.intp)
+    used = np.zeros(chromosome_length, dtype=bool)
+    free_ends = np.array(degree) < 2
+
+    current = int(args['rng'].choice(np.flatnonzero(free_ends)))
+    i = 0
+    while True:
+        previous = -1
+        while current != -1:
+            tour[i] = current
+            used[current] = True
+            i += 1
+            current, previous = links[current][links[current][0] == previous], current
+
+        if i == chromosome_length:
+            return tour
+
+        available = free_ends & ~used
+        current = int(np.argmin(np.where(available, distance_matrix[previous], np.inf)))
+
+
+def space_filling_curve(args):
+    """
+    Order the cities along a Hilbert curve.
+
+    The coordinates are jittered first, every city by up to 'sfc_jitter'
+    times the distance to its nearest neighbour, so every tour is different
+    while dense areas stay in order. The tour starts at a random city.
+
+    :param args: The global parameter dictionary.
+    :return: The tour.
+    """
+    coordinates = args['coordinates']
+    chromosome_length = len(coordinates)
+
+    cities = np.arange(chromosome_length)
+    nearest = np.asarray(args['distance_matrix'][cities, args['neighbours'][:, 0]], dtype=np.float64)
+    jitter = args.get('sfc_jitter', 0.5) * nearest[:, np.newaxis]
+    jittered = coordinates + args['rng'].uniform(-1, 1, coordinates.shape) * jitter
+
+    # Scale the (jittered) coordinates to a 2^16 x 2^16 grid
+    lower = jittered.min(axis=0)
+    extent = max(float(np.max(jittered.max(axis=0) - lower)), 1e-12)
+    cells = ((jittered - lower) / extent * (HILBERT_ORDER_SIZE - 1)).astype(np.int64)
+
+    tour = np.argsort(hilbert_index(cells[:, 0], cells[:, 1]), kind='stable')
+
+    return np.roll(tour, -args['rng'].integers(chromosome_length))
+
+
+def hilbert_index(x, y):
+    """
+    Calculate the position of grid cells along a Hilbert curve.
+
+    :param x: The integer x coordinates, in [0, HILBERT_ORDER_SIZE).
+    :param y: The integer y coordinates, in [0, HILBERT_ORDER_SIZE).
+    :return: The distance of every cell along the curve.
+    """
+    x = x.copy()
+    y = y.copy()
+    d = np.zeros(len(x), dtype=np.int64)
+
+    s = HILBERT_ORDER_SIZE // 2
+    while s > 0:
+        rx = ((x & s) > 0).astype(np.int64)
+        ry = ((y & s) > 0).astype(np.int64)
+        d += s * s * ((3 * rx) ^ ry)
+
+        # Rotate the quadrant, so the curve inside it has the right orientation
+        flip = (ry == 0) & (rx == 1)
+        x = np.where(flip, HILBERT_ORDER_SIZE - 1 - x, x)
+        y = np.where(flip, HILBERT_ORDER_SIZE - 1 - y, y)
+        swap = ry == 0
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+
+        s //= 2
+
+    return d
 
 
 def create_plotter(args):
@@ -0,0 +1,277 @@
+import multiprocessing as mp
+import queue
+import sys
+import time
+import traceback
+
+import numpy as np
+
+from . import evaluate, generation, initialize, parallel, select, telemetry
+from .population import Population, offspring_count
+from .utility import die
+
+# How often the main process checks whether the islands are still alive
+# while it waits for their results, in seconds
+ISLAND_POLL_SECONDS = 1.0
+
+# How long an island waits for migrants before giving up, in seconds
+MIGRATION_TIMEOUT = 600
+
+
+def run_islands(args, quiet=False):
+    """
+    Run the EA as an island model
+
+    'islands' populations evolve independently, each in its own process,
+    with the usual select/offspring_generation/evaluate cycle. Every
+    'migration_interval' generations, each island sends copies of its best
+    'migrants' individuals to the next island along the
+    'migration_topology': a fixed 'ring', or a 'random' ring that is
+    reshuffled at every migration. The migrants replace the worst
+    individuals of the receiving island. The islands print their
+    generations like the serial runs do, unless in quiet mode.
+
+    :param args: The global parameter dictionary
+    :param quiet: Whether the islands print no generations at all
+    :return: Sets 'population' to the final population of the island with the best individual
+    """
+    number_of_islands = args['islands']
+    topology = args.get('migration_topology', 'ring')
+    if topology not in MIGRATION_TOPOLOGIES:
+        die("Unknown migration topology: {}".format(topology))
+
+    if args.get('migrants', 2) > args['pop_size']:
+        die("migrants must not be larger than pop_size")
+
+    if args.get('migration_interval', 50) < 1:
+        die("migration_interval must be at least 1")
+
+    blocks, instance = parallel.share_instance(args)
+    parameters = parallel.worker_parameters(args)
+    parameters['quiet'] = quiet or args.get('quiet', False)
+
+    # Every island gets a copy of the same generator to shuffle a random
+    # topology, so they all agree on where migrants go. The islands' own
+    # generators are independent streams spawned from the main one as well.
+    topology_rng, *island_rngs = args['rng'].spawn(number_of_islands + 1)
+
+    inboxes = [mp.Queue() for island in range(number_of_islands)]
+    results = mp.Queue()
+    processes = [mp.Process(target=island_process,
+                            args=(island, instance, parameters, inboxes, results,
+                                  topology_rng, island_rngs[island]))
+                 for island in range(number_of_islands)]
+
+    try:
+        for process in processes:
+            process.start()
+
+        # Collect the results before joining, so no process blocks on a
+        # full queue
+        island_results = collect_results(processes, results)
+        for process in processes:
+            process.join()
+
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    print_island_stats(island_results)
+
+    # Continue with the population of the island that found the best individual
+    best = max(island_results, key=lambda result: result[1]['best'])
+    tours, fitness = best[2], best[3]
+    population = Population(len(tours), offspring_count(args['mp_size']), tours.shape[1])
+    population.tours[:] = tours
+    population.fitness[:] = fitness
+    args['population'] = population
+
+
+def collect_results(processes, results):
+    """
+    Wait for the final results of all islands
+
+    :param processes: The island processes
+    :param results: The queue the islands put their results on
+    :return: The (island, stats, tours, fitness) tuples, ordered by island
+    """
+    island_results = []
+    while len(island_results) < len(processes):
+        try:
+            result = results.get(timeout=ISLAND_POLL_SECONDS)
+        except queue.Empty:
+            # An island that crashed outright (killed, out of memory, ...)
+            # can not send an error record
+            for island, process in enumerate(processes):
+                if process.exitcode not in (None, 0):
+                    die("Island %d exited with code %d" % (island, process.exitcode))
+            continue
+
+        if 'error' in result[1]:
+            die(result[1]['error'])
+        island_results.append(result)
+
+    return sorted(island_results, key=lambda result: result[0])
+
+
+def island_process(island, instance, parameters, inboxes, results, topology_rng, rng):
+    """
+    Evolve the population of one island
+
+    :param island: The index of this island
+    :param instance: The shared instance data, see parallel.share_instance
+    :param parameters: The algorithm parameters
+    :param inboxes: A queue per island, on which it receives migrants
+    :param results: The queue to put the final statistics and population on
+    :param topology_rng: The random number generator for shuffling a random
+                         topology, the same on every island
+    :param rng: The island's random number generator
+    """
+    try:
+        evolve_island(island, instance, parameters, inboxes, results, topology_rng, rng)
+    except (Exception, SystemExit) as error:
+        # Tell the main process, which stops the other islands. die() has
+        # printed its message already.
+        if isinstance(error, SystemExit):
+            message = "island %d stopped with an error (see above)" % island
+        else:
+            message = "island %d failed:\n%s" % (island, traceback.format_exc())
+        results.put((island, {'error': message}, None, None))
+
+
+def evolve_island(island, instance, parameters, inboxes, results, topology_rng, rng):
+    """
+    Evolve the population of one island, and put its final statistics and
+    population on the results queue
+
+    See island_process for the parameters.
+    """
+    start = time.perf_counter()
+
+    # Flush every line as soon as it is written, so the lines of the
+    # islands do not get mixed up
+    sys.stdout.reconfigure(line_buffering=True)
+
+    blocks, arrays = parallel.attach_instance(instance)
+    try:
+        args = dict(parameters, **arrays)
+        args['rng'] = rng
+        args['workers'] = 1
+
+        interval = args.get('migration_interval', 50)
+        topology = MIGRATION_TOPOLOGIES[args.get('migration_topology', 'ring')]
+        number_of_islands = len(inboxes)
+        migrations = 0
+
+        # Only the console part of the telemetry; the islands write no log
+        console = telemetry.Telemetry(dict(args, telemetry_file=None), args['quiet'],
+                                      label="Island %d, generation" % island)
+
+        initialize.gen_population(args)
+        evaluate.eval_population(args)
+
+        for i in range(args['generations']):
+            args['current_gen'] = i
+            generation.next_generation(args)
+
+            if (i + 1) % interval == 0 and i + 1 < args['generations']:
+                destination = topology(island, number_of_islands, topology_rng)
+                migrate(args, inboxes[destination], inboxes[island])
+                migrations += 1
+
+            console.record(args, i)
+
+        evaluate.format_stats(args)
+        population = args['population']
+        stats = {
+            'best': -args['max'],
+            'max': args['max'],
+            'mean': args['mean'],
+            'sd': args['sd'],
+            'generations': args['generations'],
+            'migrations': migrations,
+            'seconds': time.perf_counter() - start,
+        }
+        results.put((island, stats, population.tours.copy(), population.fitness.copy()))
+
+    finally:
+        for block in blocks:
+            block.close()
+
+
+def migrate(args, outbox, inbox):
+    """
+    Send the best individuals of an island away, and take in migrants
+
+    :param args: The global parameter dictionary of the island
+    :param outbox: The queue of the destination island
+    :param inbox: The queue of this island
+    """
+    population = args['population']
+    migrants = args.get('migrants', 2)
+
+    best = select.best_indices(population.fitness, migrants)
+    outbox.put((population.tours[best].copy(), population.fitness[best].copy()))
+
+    # The arriving migrants replace the worst individuals. An island that
+    # failed sends none, so do not wait for them forever.
+    timeout = args.get('migration_timeout', MIGRATION_TIMEOUT)
+    try:
+        tours, fitness = inbox.get(timeout=timeout)
+    except queue.Empty:
+        die("No migrants arrived within %d seconds" % timeout)
+    worst = select.best_indices(-population.fitness, len(fitness))
+    population.tours[worst] = tours
+    population.fitness[worst] = fitness
+
+
+def ring_topology(island, number_of_islands, rng):
+    """
+    Each island sends its migrants to the next one
+
+    :param island: The index of the sending island
+    :param number_of_islands: The number of islands
+    :param rng: Not used here, just for compatibility.
+    :return: The index of the receiving island
+    """
+    return (island + 1) % number_of_islands
+
+
+def random_topology(island, number_of_islands, rng):
+    """
+    Each island sends its migrants to the next one along a random ring,
+    so that every island still receives exactly one batch of migrants
+
+    :param island: The index of the sending island
+    :param number_of_islands: The number of islands
+    :param rng: The generator for shuffling the ring; every island draws the
+                same ring from its own copy
+    :return: The index of the receiving island
+    """
+    ring = rng.permutation(number_of_islands)
+    position = int(np.flatnonzero(ring == island)[0])
+
+    return int(ring[(position + 1) % number_of_islands])
+
+
+def print_island_stats(island_results):
+    """
+    Print the final statistics of every island
+
+    :param island_results: The (island, stats, tours, fitness) tuples
+    """
+    print("\nIsland\tMax\tMean\tSD\tMigrations\tTime (s)")
+    for island, stats, tours, fitness in island_results:
+        print("%d\t%d\t%d\t%d\t%d\t\t%.2f" % (island, stats['max'], stats['mean'], stats['sd'],
+                                              stats['migrations'], stats['seconds']))
+    print()
+
+
+MIGRATION_TOPOLOGIES = {
+    "ring": ring_topology,
+    "random": random_topology,
+}
@@ -0,0 +1,281 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from .utility import die
+
+# Moves that shorten the tour by less than this are not applied, so that
+# rounding errors can not make the search go back and forth forever.
+LOCAL_SEARCH_EPSILON = 1e-9
+
+# The longest segment Or-opt moves to another place in the tour
+OR_OPT_SEGMENT_LENGTH = 3
+
+
+def improve_offspring(args):
+    """
+    Run a local search descent on every offspring
+
+    The descent uses the candidate neighbours of every city, don't-look bits
+    and a position array, so every candidate move is evaluated in O(1). The
+    cost per child is bounded by 'ls_max_moves' improving moves and by
+    'ls_time_budget_ms' milliseconds.
+
+    :param args: The global parameter dictionary
+    :return: Improves the population's offspring in place and updates their
+             fitness; adds 'ls_moves', 'ls_gain' and 'ls_ms' to the dictionary
+    """
+    start = time.perf_counter()
+
+    method = args['local_search']
+    if method not in LOCAL_SEARCH_FUNCTIONS:
+        die("local_search must be one of: %s" % ", ".join(sorted(LOCAL_SEARCH_FUNCTIONS)))
+    or_opt = LOCAL_SEARCH_FUNCTIONS[method]
+
+    population = args['population']
+    offspring = population.offspring
+    offspring_fitness = population.offspring_fitness
+    offspring_dirty = population.offspring_dirty
+
+    search = LocalSearch(args['distance_matrix'], args['neighbours'], or_opt)
+    max_moves = args.get('ls_max_moves')
+    time_budget = args.get('ls_time_budget_ms')
+
+    total_moves = 0
+    total_gain = 0.0
+    for i in range(len(offspring)):
+        deadline = None
+        if time_budget is not None:
+            deadline = time.perf_counter() + time_budget / 1000.0
+
+        moves, gain = search.descend(offspring[i], max_moves, deadline)
+
+        # Offspring without a fitness are evaluated afterwards anyway
+        if not offspring_dirty[i]:
+            offspring_fitness[i] += gain
+
+        total_moves += moves
+        total_gain += gain
+
+    args['ls_moves'] = total_moves
+    args['ls_gain'] = total_gain
+    args['ls_ms'] = (time.perf_counter() - start) * 1000.0
+
+
+class LocalSearch(object):
+    """
+    2-opt (and optionally Or-opt) descent restricted to candidate neighbours.
+
+    Every city starts out active, in tour order. A city whose candidate
+    moves do not improve the tour gets its don't-look bit set, and after
+    every improving move the endpoints of the changed edges are activated
+    again, so the descent ends in a local optimum of the candidate moves.
+    """
+
+    def __init__(self, distance_matrix, neighbours, or_opt=False):
+        """
+        Set up the search for one generation
+
+        :param distance_matrix: The distance matrix
+        :param neighbours: The N x k candidate neighbours of every city, nearest first
+        :param or_opt: Also try to move segments of up to three cities
+        """
+        self.distance_matrix = distance_matrix
+        self.neighbours = np.asarray(neighbours)
+        self.or_opt = or_opt
+
+        # Python lists make the inner loops a lot faster than indexing arrays
+        cities = np.arange(len(self.neighbours))[:, np.newaxis]
+        self.neighbour_lists = self.neighbours.tolist()
+        self.neighbour_distances = np.asarray(distance_matrix[cities, self.neighbours]).tolist()
+
+    def descend(self, tour, max_moves=None, deadline=None):
+        """
+        Improve a tour in place until no candidate move improves it, or the
+        budget runs out
+
+        :param tour: The tour
+        :param max_moves: The maximum number of improving moves (None for no limit)
+        :param deadline: The time.perf_counter() value to stop at (None for no limit)
+        :return: The number of moves made, and how much shorter the tour got
+        """
+        n = len(tour)
+        if n < 5:
+            return 0, 0.0
+
+        position = np.empty(n, dtype=np.intp)
+        position[tour] = np.arange(n)
+
+        # Every city starts out active
+        active = np.ones(n, dtype=bool)
+        queue = deque(tour.tolist())
+
+        moves = 0
+        gain = 0.0
+        while queue:
+            if max_moves is not None and moves >= max_moves:
+                break
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+
+            city = queue.popleft()
+            active[city] = False
+
+            move_gain, touched = self.two_opt_move(tour, position, city)
+            if not move_gain and self.or_opt:
+                move_gain, touched = self.or_opt_move(tour, position, city)
+            if not move_gain:
+                continue
+
+            moves += 1
+            gain += move_gain
+            for touched_city in touched:
+                if not active[touched_city]:
+                    active[touched_city] = True
+                    queue.append(touched_city)
+
+        return moves, gain
+
+    def two_opt_move(self, tour, position, a):
+        """
+        Find and apply the first improving 2-opt move that connects a city to
+        one of its candidate neighbours
+
+        :param tour: The tour
+        :param position: The position of every city in the tour
+        :param a: The city
+        :return: The gain of the move (0.0 if there is none), and the cities
+                 whose edges changed
+        """
+        n = len(tour)
+        distance_matrix = self.distance_matrix
+        i = position[a]
+
+        for forward in (True, False):
+            # b is the tour neighbour of a on the side we try to break
+            b = tour[(i + 1) % n] if forward else tour[i - 1]
+            d_ab = distance_matrix[a, b]
+
+            for c, d_ac in zip(self.neighbour_lists[a], self.neighbour_distances[a]):
+                # The new edge must be shorter than the one it replaces
+                if d_ac >= d_ab:
+                    break
+
+                j = position[c]
+                d = tour[(j + 1) % n] if forward else tour[j - 1]
+                if c == b or d == a:
+                    continue
+
+                move_gain = d_ab + distance_matrix[c, d] - d_ac - distance_matrix[b, d]
+                if move_gain > LOCAL_SEARCH_EPSILON:
+                    # Replace (a, b) and (c, d) by (a, c) and (b, d)
+                    if forward:
+                        reverse(tour, position, (i + 1) % n, j)
+                    else:
+                        reverse(tour, position, j, (i - 1) % n)
+                    return move_gain, (a, b, c, d)
+
+        return 0.0, ()
+
+    def or_opt_move(self, tour, position, a):
+        """
+        Find and apply the first improving move of a segment starting at a
+        city to a place next to one of its candidate neighbours
+
+        :param tour: The tour
+        :param position: The position of every city in the tour
+        :param a: The first city of the segment
+        :return: The gain of the move (0.0 if there is none), and the cities
+                 whose edges changed
+        """
+        n = len(tour)
+        distance_matrix = self.distance_matrix
+        i = position[a]
+
+        for length in range(1, min(OR_OPT_SEGMENT_LENGTH, n - 3) + 1):
+            s1, s2 = a, tour[(i + length - 1) % n]
+            p, nx = tour[i - 1], tour[(i + length) % n]
+            removal_gain = distance_matrix[p, s1] + distance_matrix[s2, nx] - distance_matrix[p, nx]
+            if removal_gain <= LOCAL_SEARCH_EPSILON:
+                continue
+
+            for c, d_cs1 in zip(self.neighbour_lists[s1], self.neighbour_distances[s1]):
+                if d_cs1 >= removal_gain:
+                    break
+                if (position[c] - i) % n < length:
+                    continue
+
+                # Insert the segment between c and its successor (s1 after
+                # c), or between c and its predecessor (reversed, s1 before c)
+                j = position[c]
+                for after in (True, False):
+                    e = tour[(j + 1) % n] if after else tour[j - 1]
+                    if (position[e] - i) % n < length:
+                        continue
+
+                    addition = d_cs1 + distance_matrix[s2, e] - distance_matrix[c, e]
+                    move_gain = removal_gain - addition
+                    if move_gain > LOCAL_SEARCH_EPSILON:
+                        move_segment(tour, position, i, length, c, after)
+                        return move_gain, (p, nx, s1, s2, c, e)
+
+        return 0.0, ()
+
+
+def reverse(tour, position, i, j):
+    """
+    Reverse the part of a tour from position i forward to position j, in
+    place, wrapping around the end of the tour
+
+    Reversing the rest of the tour instead gives the same cycle, so the
+    shorter of the two is reversed.
+
+    :param tour: The tour
+    :param position: The position of every city, updated in place
+    :param i: The first position
+    :param j: The last position
+    """
+    n = len(tour)
+    if (j - i) % n + 1 > n // 2:
+        i, j = (j + 1) % n, (i - 1) % n
+
+    if i <= j:
+        tour[i:j + 1] = tour[i:j + 1][::-1]
+        position[tour[i:j + 1]] = np.arange(i, j + 1)
+    else:
+        # The part wraps around the end of the tour
+        indices = np.concatenate((np.arange(i, n), np.arange(0, j + 1)))
+        tour[indices] = tour[indices[::-1]]
+        position[tour[indices]] = indices
+
+
+def move_segment(tour, position, i, length, c, after):
+    """
+    Move the segment of a tour starting at position i next to city c, in
+    place
+
+    :param tour: The tour
+    :param position: The position of every city, updated in place
+    :param i: The first position of the segment
+    :param length: The number of cities in the segment
+    :param c: The city to put the segment next to (not in the segment)
+    :param after: True to put the segment after c, False to put it reversed before c
+    """
+    n = len(tour)
+    rotated = np.roll(tour, -i)
+    segment, rest = rotated[:length], rotated[length:]
+    k = int(np.flatnonzero(rest == c)[0])
+
+    if after:
+        tour[:] = np.concatenate((rest[:k + 1], segment, rest[k + 1:]))
+    else:
+        tour[:] = np.concatenate((rest[:k], segment[::-1], rest[k:]))
+    position[tour] = np.arange(n)
+
+
+# Whether each local search also tries Or-opt moves
+LOCAL_SEARCH_FUNCTIONS = {
+    "two_opt": False,
+    "two_opt_or_opt": True,
+}
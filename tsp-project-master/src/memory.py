@@ -0,0 +1,226 @@
+import json
+import os
+import sys
+import tracemalloc
+
+from .telemetry import STAGES
+from .utility import die
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# The number of allocation sites listed in the report
+MEMORY_TOP_SITES = 10
+
+# The number of stack frames tracemalloc stores for every allocation
+MEMORY_TRACE_FRAMES = 1
+
+MEGABYTE = 1 << 20
+
+
+def current_rss():
+    """
+    Get the resident set size of this process
+
+    :return: The RSS in bytes (the peak RSS where it can not be read)
+    """
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def peak_rss():
+    """
+    Get the peak resident set size of this process
+
+    :return: The peak RSS in bytes, or 0 if it is not available
+    """
+    if resource is None:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemoryTracker(object):
+    """
+    Tracks the memory use of every stage, with tracemalloc and the RSS.
+
+    telemetry.stage calls begin_stage() and end_stage() around every stage.
+    For every stage this records the net allocations, the peak of the
+    traced memory within the stage, and the largest RSS after it. Whenever
+    the traced memory reaches a new high after a stage, a tracemalloc
+    snapshot is taken, so the report can list the allocation sites at the
+    high-water mark.
+
+    Worker processes run a tracker of their own (see parallel.init_worker),
+    and the pool passes their snapshot() to add_worker_snapshot(). If
+    'memory_budget_mb' is set, a process whose RSS exceeds it stops the
+    program.
+    """
+
+    def __init__(self, args, report_path=None):
+        """
+        Start tracing the allocations of this process
+
+        :param args: The global parameter dictionary
+        :param report_path: The default path of the JSON report
+        """
+        self.report_path = args.get('memory_report', report_path)
+        self.budget = args.get('memory_budget_mb')
+
+        # Forked workers inherit the traces of the parent, so start afresh
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        tracemalloc.start(MEMORY_TRACE_FRAMES)
+
+        self.stages = {}
+        self.traced_peak = 0
+        self.high_water = 0
+        self.high_water_snapshot = None
+        self.workers = {}
+
+    def begin_stage(self):
+        """
+        Start measuring a stage
+
+        :return: The traced memory at the start, for end_stage
+        """
+        traced, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        return traced
+
+    def end_stage(self, name, start):
+        """
+        Record the memory use of a stage, and enforce the budget
+
+        :param name: The name of the stage
+        :param start: The value returned by begin_stage
+        """
+        traced, peak = tracemalloc.get_traced_memory()
+        rss = current_rss()
+
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {'calls': 0, 'allocated': 0, 'peak': 0, 'rss': 0}
+        stage['calls'] += 1
+        stage['allocated'] += traced - start
+        stage['peak'] = max(stage['peak'], peak - start)
+        stage['rss'] = max(stage['rss'], rss)
+
+        self.traced_peak = max(self.traced_peak, peak)
+        if traced > self.high_water:
+            self.high_water = traced
+            self.high_water_snapshot = tracemalloc.take_snapshot()
+
+        self.check_budget(rss, "after stage '%s'" % name)
+
+    def check_budget(self, rss, where):
+        """
+        Stop the program if an RSS exceeds 'memory_budget_mb'
+
+        :param rss: The RSS in bytes
+        :param where: Where the RSS was measured, for the error message
+        """
+        if self.budget is not None and rss > self.budget * MEGABYTE:
+            die("Memory budget of %d MB exceeded %s: RSS %.1f MB" % (self.budget, where, rss / MEGABYTE))
+
+    def snapshot(self):
+        """
+        Summarize the memory use of this process
+
+        :return: A picklable dictionary
+        """
+        self.traced_peak = max(self.traced_peak, tracemalloc.get_traced_memory()[1])
+        rss = current_rss()
+
+        return {
+            'pid': os.getpid(),
+            'rss': rss,
+            'peak_rss': max([peak_rss(), rss] + [stage['rss'] for stage in self.stages.values()]),
+            'traced_peak': self.traced_peak,
+            'stages': self.stages,
+        }
+
+    def add_worker_snapshot(self, snapshot):
+        """
+        Take in the memory use of a worker process, after one of its tasks
+
+        :param snapshot: The worker's snapshot()
+        """
+        worker = self.workers.setdefault(snapshot['pid'], {'tasks': 0})
+        worker['tasks'] += 1
+        worker.update(snapshot)
+
+        self.check_budget(snapshot['rss'], "in worker %d" % snapshot['pid'])
+
+    def top_sites(self):
+        """
+        Get the allocation sites that held the most memory at the high-water mark
+
+        :return: A list of (site, bytes, number of blocks)
+        """
+        if self.high_water_snapshot is None:
+            return []
+
+        # Leave out the memory of the import machinery and of tracemalloc itself
+        statistics = self.high_water_snapshot.filter_traces((
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        )).statistics('lineno')
+
+        return [(str(statistic.traceback), statistic.size, statistic.count)
+                for statistic in statistics[:MEMORY_TOP_SITES]]
+
+    def report(self, population=None):
+        """
+        Print the memory use per stage, per worker and per allocation site,
+        and write it to 'memory_report' as JSON
+
+        :param population: The final population, for the bytes per individual
+        """
+        process = self.snapshot()
+
+        print("\n%-20s%8s%16s%16s%12s" % ("Stage", "Calls", "Allocated (MB)", "Peak (MB)", "RSS (MB)"))
+        for name, stage in self.stages.items():
+            print("%-20s%8d%16.2f%16.2f%12.1f" % (name, stage['calls'], stage['allocated'] / MEGABYTE,
+                                                 stage['peak'] / MEGABYTE, stage['rss'] / MEGABYTE))
+        print("Main process: peak RSS %.1f MB, traced peak %.1f MB" % (
+            process['peak_rss'] / MEGABYTE, process['traced_peak'] / MEGABYTE))
+
+        for pid, worker in sorted(self.workers.items()):
+            print("Worker %d: %d tasks, peak RSS %.1f MB, traced peak %.1f MB" % (
+                pid, worker['tasks'], worker['peak_rss'] / MEGABYTE, worker['traced_peak'] / MEGABYTE))
+
+        per_individual = {}
+        if population is not None:
+            individuals = population.pop_size + population.offspring_size
+            per_individual['population'] = population.nbytes / individuals
+            generation_peaks = [stage['peak'] for name, stage in self.stages.items() if name in STAGES]
+            per_individual['peak_stage'] = max(generation_peaks or [0]) / individuals
+            print("Bytes per individual: %.0f in the population arrays, %.0f at the peak of a generation stage" % (
+                per_individual['population'], per_individual['peak_stage']))
+
+        sites = self.top_sites()
+        if sites:
+            print("\nTop allocation sites at the high-water mark (%.1f MB traced):" % (self.high_water / MEGABYTE))
+            for site, size, count in sites:
+                print("%10.2f MB %8d blocks  %s" % (size / MEGABYTE, count, site))
+
+        if self.report_path is not None:
+            with open(self.report_path, 'w') as fp:
+                json.dump({
+                    'process': process,
+                    'workers': list(self.workers.values()),
+                    'bytes_per_individual': per_individual,
+                    'high_water': self.high_water,
+                    'top_sites': [{'site': site, 'size': size, 'count': count} for site, size, count in sites],
+                }, fp, indent=2)
+            print("Memory report written to %s" % self.report_path)
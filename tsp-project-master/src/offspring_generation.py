@@ -1,7 +1,7 @@
-import random
+import functools
 
+from . import evaluate
 from .utility import *
-import multiprocessing as mp
 
 
 def recombination(args):
@@ -9,261 +9,632 @@ def recombination(args):
     Breed offspring from the mating pool
 
     :param args: The global parameter dictionary
-    :return:
+    :return: Writes the children into the population's offspring rows
     """
     population = args['population']
     parents = args['mating_pool']
     mp_size = args['mp_size']
     crossover_rate = args['crossover_rate']
     recombination_type = args['recombination']
-    fitness = args['fitness']
 
-    parent_idx = 0
-    number_of_children = 0
-    results = []
+    if recombination_type not in ('cut_crossfill', 'best_order', 'edge_recombination'):
+        die("Unknown recombination type: {}".format(recombination_type))
+
+    tours = population.tours
+    fitness = population.fitness
+    offspring = population.offspring
+    offspring_fitness = population.offspring_fitness
+    offspring_dirty = population.offspring_dirty
+
+    # Walk through the mating pool two parents at a time, wrapping around
+    # until every offspring slot is filled, and decide for every pair
+    # whether it is crossed over.
+    parents = np.asarray(parents)
+    number_of_pairs = population.offspring_size // 2
+    parent_idx = 2 * np.arange(number_of_pairs) % mp_size
+    parents1 = parents[parent_idx]
+    parents2 = parents[(parent_idx + 1) % mp_size]
+    rng = args['rng']
+    crossover = rng.random(number_of_pairs) < crossover_rate
+
+    # Untouched copies of the parents keep the parents' fitness
+    copied = np.flatnonzero(~crossover)
+    for child_offset, copied_parents in ((0, parents1[copied]), (1, parents2[copied])):
+        offspring[2 * copied + child_offset] = tours[copied_parents]
+        offspring_fitness[2 * copied + child_offset] = fitness[copied_parents]
+        offspring_dirty[2 * copied + child_offset] = False
+
+    # Only true crossover children need a full evaluation
+    crossed = np.flatnonzero(crossover)
+    offspring_dirty[2 * crossed] = True
+    offspring_dirty[2 * crossed + 1] = True
+
+    if recombination_type == 'cut_crossfill' and crossed.size:
+        children1, children2 = batch_cut_crossfill(tours[parents1[crossed]], tours[parents2[crossed]], rng)
+        offspring[2 * crossed] = children1
+        offspring[2 * crossed + 1] = children2
+
+    if recombination_type == 'best_order':
+        n = args['box_cutting_points_n']
+        chromosome_length = population.chromosome_length
+
+        error = check_cutting_points(chromosome_length, n)
+        if error:
+            die(error)
+
+        best_individual = tours[np.argmax(fitness)]
+        best_positions = inverse_permutation(best_individual)
+        cutting_points = sample_cutting_points(chromosome_length, n, rng, len(crossed))
+
+        for pair, q in zip(crossed, cutting_points):
+            offspring[2 * pair], offspring[2 * pair + 1] = best_order(
+                chromosome_length, n, tours[parents1[pair]], tours[parents2[pair]],
+                best_individual, rng, best_positions, q,
+            )
+
+    if recombination_type == 'edge_recombination':
+        distance_matrix = args['distance_matrix']
+        neighbours = args.get('neighbours')
+        for pair in crossed:
+            parent1, parent2 = tours[parents1[pair]], tours[parents2[pair]]
+            offspring[2 * pair] = edge_recombination(
+                parent1, parent2, parent1[0], rng, distance_matrix, neighbours)
+            offspring[2 * pair + 1] = edge_recombination(
+                parent1, parent2, parent2[0], rng, distance_matrix, neighbours)
+
+
+def best_order(J, n, parent1, parent2, best_individual, rng, best_positions=None,
+               cutting_points=None):
+    """
+    Applies best-order crossover and produces two offspring
+    using the order information from three parents.
+
+    :param J: The length of our chromosome
+    :param n: The number of cutting points for crossover
+    :param parent1: Our first parent
+    :param parent2: The second parent
+    :param best_individual: The best individual in our population
+    :param rng: The random number generator
+    :param best_positions: The inverse permutation of best_individual, if already known
+    :param cutting_points: The n cutting points 0 = q1 < ... < qn = J (default: random)
+    :return: Two offspring
+    """
+    if cutting_points is None:
+        cutting_points = sample_cutting_points(J, n, rng)[0]
+    q = cutting_points
+
+    # For each resulting sub-sequence,
+    # Generate a random integer r, between [1, 3] (inclusive)
+    parent_choices = rng.integers(1, 4, size=n - 1)
+
+    # Each allele is sorted within its sub-sequence by a key that depends on r:
+    #  - If r == 1, then the alleles corresponding to this sub-sequence will
+    #    be taken from Parent 1 in the order that they are in Parent 1.
+    #  - If r == 2, then the alleles corresponding to this sub-sequence will
+    #    be taken from Parent 1, but in the order that they appear in Parent 2.
+    #  - If r == 3, then the alleles corresponding to this sub-sequence will
+    #    be taken from Parent 1, but in the order that they appear in the best
+    #    individual obtained up till the current generation.
+    # The orders come from position (inverse permutation) arrays, so that a
+    # single sort by (sub-sequence, key) builds the whole offspring.
+    parent1 = np.asarray(parent1)
+    parent2 = np.asarray(parent2)
+    if best_positions is None:
+        best_positions = inverse_permutation(best_individual)
+
+    subsequences = np.repeat(np.arange(n - 1), np.diff(q))
+    choices = np.asarray(parent_choices)[subsequences]
+    own_order = np.arange(J)
+
     offspring = []
+    for parent, other in ((parent1, parent2), (parent2, parent1)):
+        keys = np.where(choices == 1, own_order,
+                        np.where(choices == 2, inverse_permutation(other)[parent],
+                                 best_positions[parent]))
+        offspring.append(parent[np.lexsort((keys, subsequences))])
 
-    while number_of_children < mp_size:
-        parent1 = population[parents[parent_idx]]
-        parent2 = population[parents[parent_idx + 1]]
+    return offspring[0], offspring[1]
 
-        if random.random() < crossover_rate:
-            if recombination_type == 'cut_crossfill':
-                results.append(
-                    cut_crossfill(
-                        np.array(parent1), np.array(parent2)
-                    )
-                )
 
-            if recombination_type == 'best_order':
-                n = args['box_cutting_points_n']
-                chromosome_length = len(population[0])
+def check_cutting_points(J, n):
+    """
+    Checks that best-order crossover can cut a chromosome as configured.
 
-                if n < 5 or (n > chromosome_length - 1):
-                    die("box_cutting_points_n is out of range")
+    The n cutting points split the chromosome into n - 1 sub-sequences,
+    each at least 1 and at most J / 3 alleles long.
 
-                best_individual = population[np.argmax(fitness)]
-                results.append(
-                    best_order(
-                        chromosome_length, n, parent1, parent2, best_individual,
-                    )
-                )
+    :param J: The length of our chromosome
+    :param n: The number of cutting points for crossover
+    :return: An error message, or None if the configuration is valid
+    """
+    if n < 5 or (n > J - 1):
+        return "box_cutting_points_n is out of range"
 
-        else:
-            offspring.append(parent1.copy())
-            offspring.append(parent2.copy())
+    if (n - 1) * (J // 3) < J:
+        return ("box_cutting_points_n = {} is too small: {} sub-sequences of at most "
+                "{} alleles cannot cover a chromosome of length {}".format(n, n - 1, J // 3, J))
 
-        number_of_children += 2
-        parent_idx = (parent_idx + 2) % mp_size
+    return None
 
-    for element in results:
-        offspring.append(list(element[0]))
-        offspring.append(list(element[1]))
 
-    # Return the children
-    args['offspring'] = offspring
+# How many rounds of plain rejection sampling sample_cutting_points tries
+# before it builds the remaining cutting point sequences directly.
+CUTTING_POINT_REJECTION_ROUNDS = 2
 
 
-def best_order(J, n, parent1, parent2, best_individual):
+@functools.lru_cache(maxsize=8)
+def cutting_point_table(J, n):
     """
-    Applies best-order crossover and produces two offspring
-    using the order information from three parents.
+    Counts the valid ways to finish a cutting point sequence.
+
+    Row r holds, for every remaining length s, the (scaled) number of ways
+    to split s alleles into r sub-sequences of 1 to J / 3 alleles, as a
+    cumulative sum with a leading zero, so that the counts of any range of
+    lengths are a difference of two entries.
 
     :param J: The length of our chromosome
     :param n: The number of cutting points for crossover
-    :param parent1: Our first parent
-    :param parent2: The second parent
-    :param best_individual: The best individual in our population
-    :return: Two offspring
+    :return: An (n - 1) x (J + 2) array
     """
-    np.random.seed()
+    max_length = J // 3
+    lengths = np.arange(J + 1)
+    table = np.zeros((n - 1, J + 2))
+
+    counts = np.zeros(J + 1)
+    counts[0] = 1
+    table[0, 1:] = np.cumsum(counts)
+
+    for r in range(1, n - 1):
+        # counts[s] = sum of the previous row's counts[s - max_length:s]
+        previous = table[r - 1]
+        counts = previous[lengths] - previous[np.maximum(lengths - max_length, 0)]
 
-    q = np.arange(n)
-    q[-1] = J
+        # The other n - 1 - r sub-sequences take at least one allele each,
+        # so longer remainders never occur. Leave them out before rescaling
+        # the row, since the counts themselves overflow quickly.
+        counts[J - (n - 1 - r) + 1:] = 0
+        counts = np.maximum(counts, 0)
+        counts /= counts.max()
+        table[r, 1:] = np.cumsum(counts)
+
+    return table
+
+
+def sample_cutting_points(J, n, rng, size=1):
+    """
+    Draws random cutting point sequences for best-order crossover.
+
+    Every valid sequence is equally likely. A few rounds of plain rejection
+    sampling are tried first, since they accept nearly every draw for
+    typical settings. Any sequences still missing are then built directly,
+    so the cost is bounded even when valid sequences are rare.
+
+    :param J: The length of our chromosome
+    :param n: The number of cutting points for crossover
+    :param rng: The random number generator
+    :param size: The number of sequences to draw
+    :return: A size x n array, where every row is 0 = q1 < q2 < ... < qn = J
+    """
+    error = check_cutting_points(J, n)
+    if error:
+        raise ValueError(error)
+
+    q = np.zeros((size, n), dtype=int)
+    q[:, -1] = J
+    pending = np.arange(size)
+
+    for attempt in range(CUTTING_POINT_REJECTION_ROUNDS):
+        if not pending.size:
+            break
 
-    bad_cutting_point_sequence = True
-    while bad_cutting_point_sequence:
         # Randomly pick the desired number of crossover points.
         # Constraint 1 <= q1 < q2 < ... < qn < J.
-        subarray = np.random.choice(np.arange(1, J), n - 2, replace=False)
-        subarray.sort()
-        q[1:n - 1] = subarray
-
-        if len(q) != n:
-            die("wrong size")
-        # Hypothesis: cutting point sequence is good
-        bad_cutting_point_sequence = False
-
-        # Try to disprove the hypothesis at every cutting point
-        for i in range(0, len(q) - 1):
-            l_i = q[i + 1] - q[i]
-            # Constraint on length of subsequences:
-            # 0 <= l_i <= J / 3
-            if not (0 <= l_i and l_i <= J // 3):
-                bad_cutting_point_sequence = True
+        keys = rng.random((len(pending), J - 1))
+        points = np.sort(np.argpartition(keys, n - 3, axis=1)[:, :n - 2], axis=1) + 1
 
-    # For each resulting sub-sequence,
-    # Generate a random integer r, between [1, 3] (inclusive)
-    parent_choices = [random.randint(1, 3) for subsequence in range(n - 1)]
+        # Constraint on length of subsequences:
+        # 0 <= l_i <= J / 3
+        lengths = np.diff(points, axis=1, prepend=0, append=J)
+        valid = (lengths <= J // 3).all(axis=1)
 
-    offspring1 = np.zeros(J, dtype=int)
-    offspring2 = np.zeros(J, dtype=int)
+        q[pending[valid], 1:-1] = points[valid]
+        pending = pending[~valid]
 
-    for i in range(len(q) - 1):
-        sp = q[i]
-        ep = q[i + 1]
+    if pending.size:
+        q[pending] = construct_cutting_points(J, n, rng, len(pending))
 
-        if parent_choices[i] == 1:
-            # If r == 1, then the alleles corresponding to this sub-sequence will
-            # be taken from Parent 1 in the order that they are in Parent 1.
-            alleles1 = parent1[sp:ep]
-            alleles2 = parent2[sp:ep]
+    return q
 
-        if parent_choices[i] == 2:
-            # If r == 2, then the alleles corresponding to this sub-sequence will
-            # be taken from Parent 1, but in the order that they appear in Parent 2.
-            alleles1 = order_subset_from_full_set(parent1[sp:ep], parent2)
-            alleles2 = order_subset_from_full_set(parent2[sp:ep], parent1)
 
-        if parent_choices[i] == 3:
-            # If r == 3, then the alleles corresponding to this sub-sequence will
-            # be taken from Parent 1, but in the order that they appear in the best
-            # individual obtained up till the current generation.
-            alleles1 = order_subset_from_full_set(parent1[sp:ep], best_individual)
-            alleles2 = order_subset_from_full_set(parent2[sp:ep], best_individual)
+def construct_cutting_points(J, n, rng, size=1):
+    """
+    Builds random cutting point sequences for best-order crossover directly.
 
-        offspring1[sp:ep] = alleles1
-        offspring2[sp:ep] = alleles2
+    The sub-sequence lengths are drawn one after the other, each in
+    proportion to the number of valid ways to finish the sequence, so every
+    valid sequence is equally likely and none is ever rejected. The cost is
+    n - 1 vectorized steps for the whole batch.
 
-    return offspring1, offspring2
+    :param J: The length of our chromosome
+    :param n: The number of cutting points for crossover
+    :param rng: The random number generator
+    :param size: The number of sequences to draw
+    :return: A size x n array, where every row is 0 = q1 < q2 < ... < qn = J
+    """
+    table = cutting_point_table(J, n)
+    max_length = J // 3
+    remaining = np.full(size, J)
+    q = np.zeros((size, n), dtype=int)
 
+    for i in range(1, n - 1):
+        parts = n - i
 
-def cut_crossfill(parent1, parent2):
-    np.random.seed()
-    chromosome_length = parent1.size
-    crossover_point = np.random.randint(0, chromosome_length - 2)
+        # Lengths that leave a valid remainder for the other parts - 1
+        low = np.maximum(1, remaining - (parts - 1) * max_length)
+        high = np.minimum(max_length, remaining - (parts - 1))
 
-    # Offspring 1
-    crossover_idx = crossover_point + 1
+        # Draw the remainder t = remaining - length in [first, last], with
+        # weight equal to the number of ways to split t into parts - 1
+        first = remaining - high
+        last = remaining - low
+        cumulative = table[parts - 1]
+        total = cumulative[last + 1] - cumulative[first]
+        u = rng.random(size)
+        t = np.searchsorted(cumulative, cumulative[first] + u * total, side='right') - 1
+        t = np.clip(t, first, last)
 
-    # Copy until the crossover point from parent1
-    offspring1 = parent1.copy()
-    offspring_idx = crossover_idx
+        # Fall back to a uniform draw where rounding left no weight
+        unweighted = total <= 0
+        t[unweighted] = first[unweighted] + (u[unweighted] * (last - first + 1)[unweighted]).astype(int)
 
-    # Fill the other half of offspring until we have full coverage
-    while offspring_idx != chromosome_length:
+        q[:, i] = q[:, i - 1] + remaining - t
+        remaining = t
 
-        # Grab an allele from parent2
-        parent_allele = parent2[crossover_idx]
+    q[:, -1] = J
 
-        # if it's not in offspring1, put it there
-        if parent_allele not in offspring1[:offspring_idx]:
-            offspring1[offspring_idx] = parent_allele
-            offspring_idx += 1
+    return q
 
-        # increment and wrap around index pointer
-        crossover_idx = (crossover_idx + 1) % chromosome_length
 
-    # as above
-    crossover_idx = crossover_point + 1
-    offspring2 = parent2.copy()
-    offspring_idx = crossover_idx
-    while offspring_idx != chromosome_length:
-        parent_allele = parent1[crossover_idx]
-        if parent_allele not in offspring2[:offspring_idx]:
-            offspring2[offspring_idx] = parent_allele
-            offspring_idx += 1
-        crossover_idx = (crossover_idx + 1) % chromosome_length
+def edge_recombination(parent1, parent2, start, rng, distance_matrix=None, neighbours=None):
+    """
+    Applies edge recombination crossover and produces one offspring
+
+    The child is built city by city from an adjacency table, which lists the
+    neighbours of every city in both parents. From the current city, it
+    follows an edge both parents share if there is one, and otherwise the
+    neighbour with the fewest neighbours left (ties are broken randomly), so
+    nearly every edge of the child comes from a parent. If the current city
+    has no neighbours left, it continues with the nearest unvisited city.
+
+    :param parent1: The first parent
+    :param parent2: The second parent
+    :param start: The first city of the child
+    :param rng: The random number generator
+    :param distance_matrix: The distance matrix (optional; without it, a
+                            dead end continues at a random unvisited city)
+    :param neighbours: The candidate neighbours of every city (optional)
+    :return: The child
+    """
+    n = len(parent1)
+
+    # The adjacency table; an edge that is in both parents is listed twice
+    adjacency = np.empty((n, 4), dtype=np.intp)
+    for k, parent in enumerate((parent1, parent2)):
+        adjacency[parent, 2 * k] = np.roll(parent, 1)
+        adjacency[parent, 2 * k + 1] = np.roll(parent, -1)
+    table = adjacency.tolist()
+
+    # The unvisited cities, in a list with a position index so that a
+    # visited city is removed (and a random one picked) in constant time
+    unvisited = list(range(n))
+    unvisited_index = list(range(n))
+    visited = bytearray(n)
+
+    child = np.empty(n, dtype=parent1.dtype)
+    current = int(start)
+    for i in range(n):
+        child[i] = current
+        visited[current] = 1
+
+        last = unvisited.pop()
+        if last != current:
+            unvisited[unvisited_index[current]] = last
+            unvisited_index[last] = unvisited_index[current]
+
+        # Take the current city out of the lists of its neighbours
+        remaining = table[current]
+        for city in set(remaining):
+            if not visited[city]:
+                table[city] = [c for c in table[city] if c != current]
+
+        if i == n - 1:
+            break
+
+        if remaining:
+            shared = [c for c in remaining if remaining.count(c) > 1 and not visited[c]]
+            if shared:
+                current = shared[0]
+                continue
+
+            fewest = None
+            for city in set(remaining):
+                if visited[city]:
+                    continue
+                count = len(set(table[city]))
+                if fewest is None or count < fewest:
+                    fewest, choices = count, [city]
+                elif count == fewest:
+                    choices.append(city)
+            if fewest is not None:
+                current = choices[rng.integers(len(choices))] if len(choices) > 1 else choices[0]
+                continue
+
+        # Dead end: continue at the nearest unvisited city. The candidate
+        # neighbours are tried first, as they usually contain one.
+        current = None
+        if neighbours is not None:
+            for city in neighbours[child[i]]:
+                if not visited[city]:
+                    current = int(city)
+                    break
+        if current is None and distance_matrix is not None:
+            cities = np.array(unvisited)
+            current = int(cities[np.argmin(distance_matrix[child[i]][cities])])
+        if current is None:
+            current = unvisited[rng.integers(len(unvisited))]
+
+    return child
+
+
+def cut_crossfill(parent1, parent2, rng):
+    """
+    Applies cut-and-crossfill crossover and produces two offspring.
+
+    :param parent1: Our first parent
+    :param parent2: The second parent
+    :param rng: The random number generator
+    :return: Two offspring
+    """
+    offspring1, offspring2 = batch_cut_crossfill(
+        np.asarray(parent1)[np.newaxis, :], np.asarray(parent2)[np.newaxis, :], rng)
+
+    return offspring1[0], offspring2[0]
+
+
+def batch_cut_crossfill(parents1, parents2, rng, crossover_points=None):
+    """
+    Applies cut-and-crossfill crossover to many pairs of parents at once.
+
+    Each offspring keeps its own parent up to and including a random
+    crossover point. The rest is filled with the missing alleles in the
+    order they appear in the other parent, starting right after the
+    crossover point and wrapping around. A membership bitmap of the alleles
+    already kept makes every child O(N).
+
+    :param parents1: The first parent of every pair, one per row
+    :param parents2: The second parent of every pair, one per row
+    :param rng: The random number generator
+    :param crossover_points: The crossover point of every pair (default: random)
+    :return: The first and the second offspring of every pair, one per row
+    """
+    number_of_pairs, chromosome_length = parents1.shape
+    if crossover_points is None:
+        crossover_points = rng.integers(0, chromosome_length - 2, size=number_of_pairs)
+
+    rows = np.arange(number_of_pairs)[:, np.newaxis]
+    positions = np.arange(chromosome_length)[np.newaxis, :]
+    kept = positions <= crossover_points[:, np.newaxis]
+
+    # The order in which the other parent's alleles are considered
+    fill_order = (positions + crossover_points[:, np.newaxis] + 1) % chromosome_length
+
+    offspring1 = crossfill(parents1, parents2, kept, rows, fill_order)
+    offspring2 = crossfill(parents2, parents1, kept, rows, fill_order)
 
     return offspring1, offspring2
 
 
+def crossfill(heads, fillers, kept, rows, fill_order):
+    """
+    Completes the kept head of every offspring with the missing alleles.
+
+    :param heads: The parents that provide the head of every offspring
+    :param fillers: The parents that provide the rest, one per row
+    :param kept: Which positions of heads are kept
+    :param rows: A column of row indices
+    :param fill_order: The positions of fillers, in the order they are considered
+    :return: The offspring, one per row
+    """
+    # used[row, allele] is True if the allele is in the kept head of the row
+    used = np.zeros(heads.shape, dtype=bool)
+    used[rows, heads] = kept
+
+    # Every row has exactly as many missing alleles as free positions, so
+    # the row-major boolean selections line up row by row.
+    candidates = fillers[rows, fill_order]
+    offspring = heads.copy()
+    offspring[~kept] = candidates[~used[rows, candidates]]
+
+    return offspring
+
+
 def mutation(args):
+    """
+    Mutate the offspring
+
+    The mutation operators change the offspring in place and report the
+    edges they removed and added, so the fitness of an offspring that is
+    already known (an untouched copy of a parent) is updated incrementally
+    instead of re-evaluating the whole tour.
+
+    :param args: The global parameter dictionary
+    :return: Updates the population's offspring and their fitness
+    """
     mutation_rate = args['mutation_rate']
     mutation_func = MUTATION_FUNCTIONS[args['mutation']]
-    offspring = args['offspring']
+    guided = args['mutation'] in GUIDED_MUTATION_FUNCTIONS
+    if guided:
+        mutation_func = functools.partial(mutation_func, neighbours=args['neighbours'])
+    population = args['population']
+    offspring = population.offspring
+    offspring_fitness = population.offspring_fitness
+    offspring_dirty = population.offspring_dirty
+    distance_matrix = args['distance_matrix']
+
+    chromosome_length = population.chromosome_length
+    kca_k = int(args['kca_k'] * chromosome_length)
+    length = int(chromosome_length / kca_k)
+
+    # Decide for all offspring at once which of them are mutated
+    rng = args['rng']
+    mutated = np.flatnonzero(rng.random(len(offspring)) < mutation_rate)
+
+    # The guided mutations look up the positions of neighbours; build the
+    # position arrays of all mutated offspring in one scatter
+    if guided:
+        positions = np.empty((len(mutated), chromosome_length), dtype=np.intp)
+        positions[np.arange(len(mutated))[:, np.newaxis], offspring[mutated]] = np.arange(chromosome_length)
+
+    for row, i in enumerate(mutated):
+        if guided:
+            removed, added = mutation_func(offspring[i], rng, length=length, positions=positions[row])
+        else:
+            removed, added = mutation_func(offspring[i], rng, length=length)
+
+        if not offspring_dirty[i]:
+            offspring_fitness[i] -= evaluate.edge_delta(distance_matrix, removed, added)
 
-    for i in range(len(offspring)):
-        if random.random() < mutation_rate:
-            chromosome_length = len(args['population'][0])
-            kca_k = int(args['kca_k'] * chromosome_length)
-            length = int(chromosome_length / kca_k)
-            offspring[i] = mutation_func(offspring[i], length=length)
 
-def permutation_swap(individual, length=-1):
+def tour_edges(tour, edge_indices):
     """
-    Swaps two alleles randomly in a chromosome.
+    Get the edges of a tour that start at the given positions
+
+    Edge i connects tour[i] and tour[i + 1], wrapping around at the end of
+    the tour. Positions are taken modulo the tour length, and each edge is
+    reported once.
+
+    :param tour: The chromosome
+    :param edge_indices: The positions of the edges
+    :return: A list of (city1, city2) tuples
+    """
+    n = len(tour)
+    return [(tour[i], tour[(i + 1) % n]) for i in sorted(set(i % n for i in edge_indices))]
+
+
+def valid_positions(individual, positions):
+    """
+    Check that a pair of mutation points lies inside the chromosome
+
+    Points that fall outside of it (possible with large cluster lengths on
+    small instances) leave the chromosome unchanged.
 
     :param individual: The chromosome
-    :return: A mutated copy of the chromosome
+    :param positions: The sorted mutation points
+    :return: True if 0 <= positions[0] <= positions[1] < len(individual)
+    """
+    return 0 <= positions[0] <= positions[-1] < len(individual)
+
+
+def permutation_swap(individual, rng, length=-1):
     """
-    # copy the individual
-    mutant = individual.copy()
+    Swaps two alleles randomly in a chromosome, in place.
 
+    :param individual: The chromosome
+    :param rng: The random number generator
+    :return: The removed and added edges
+    """
     # define mutation points
     point1, point2 = 0, 0
 
     # if the points are the same, generate two new numbers
     while point1 == point2:
-        point1 = random.randint(0, len(mutant) - 1)
-        point2 = random.randint(0, len(mutant) - 1)
+        point1, point2 = rng.integers(len(individual), size=2).tolist()
+
+    changed = [point1 - 1, point1, point2 - 1, point2]
+    removed = tour_edges(individual, changed)
 
     # swap the elements
-    mutant[point1], mutant[point2] = mutant[point2], mutant[point1]
-    return mutant
+    individual[[point1, point2]] = individual[[point2, point1]]
+
+    return removed, tour_edges(individual, changed)
 
 
-def insertion_mutation(individual, length=-1):
+def insertion_mutation(individual, rng, length=-1):
     """
     Inserts a random allele adjacent to another random allele
-    in a given chromosome
+    in a given chromosome, in place.
 
     :param individual: The chromosome to mutate
+    :param rng: The random number generator
     :param length: The size of the inversion
-    :return: A mutated copy of the chromosome
+    :return: The removed and added edges
     """
-    positions = get_random_positions_based_on_cluster_size(individual, length)
-    mutant = individual[:positions[0]] + individual[positions[0] + 1:positions[1] + 1]
-    mutant.append(individual[positions[0]])
-    mutant.extend(individual[positions[1] + 1:])
-    return mutant
+    positions = get_random_positions_based_on_cluster_size(individual, length, rng)
+    if not valid_positions(individual, positions):
+        return [], []
 
+    # The alleles between the two points shift by one, but keep their
+    # neighbours, so only three edges change.
+    removed = tour_edges(individual, [positions[0] - 1, positions[0], positions[1]])
 
-def inversion_swap(individual, length=-1):
+    allele = individual[positions[0]]
+    individual[positions[0]:positions[1]] = individual[positions[0] + 1:positions[1] + 1]
+    individual[positions[1]] = allele
+
+    return removed, tour_edges(individual, [positions[0] - 1, positions[1] - 1, positions[1]])
+
+
+def inversion_swap(individual, rng, length=-1):
     """
-    Inverts a random subset of alleles in a given chromosome
+    Inverts a random subset of alleles in a given chromosome, in place.
 
     :param individual: The chromosome
+    :param rng: The random number generator
     :param length: The size of the inversion
-    :return: A mutated copy of the chromosome.
+    :return: The removed and added edges
     """
-    positions = get_random_positions_based_on_cluster_size(individual, length)
-    seq = individual[positions[0]:positions[1] + 1]
-    seq.reverse()
-    return individual[:positions[0]] + seq + individual[positions[1] + 1:]
+    positions = get_random_positions_based_on_cluster_size(individual, length, rng)
+    if not valid_positions(individual, positions):
+        return [], []
+
+    # The distances are symmetric, so only the two edges at the ends of the
+    # inverted subset change.
+    changed = [positions[0] - 1, positions[1]]
+    removed = tour_edges(individual, changed)
+
+    individual[positions[0]:positions[1] + 1] = individual[positions[0]:positions[1] + 1][::-1]
 
+    return removed, tour_edges(individual, changed)
 
-def two_opt_swap(individual, length=None):
+
+def two_opt_swap(individual, rng, length=None):
     """
-    Picks two adjacent pairs of alleles and swaps their respective elements.
+    Picks two adjacent pairs of alleles and swaps their respective elements,
+    in place.
 
     :param individual: The chromosome.
+    :param rng: The random number generator
     :param length: Not used here, just for compatibility.
-    :return: A mutated copy of the chromosome.
+    :return: The removed and added edges
     """
 
-    positions = get_random_positions_based_on_cluster_size(individual, 3)
+    positions = get_random_positions_based_on_cluster_size(individual, 3, rng)
+    if not valid_positions(individual, positions):
+        return [], []
+
+    changed = range(positions[0] - 1, positions[1] + 1)
+    removed = tour_edges(individual, changed)
+
     pair1 = [positions[0], positions[0] + 1]
     pair2 = [positions[-1] - 1, positions[-1]]
-    seq1 = individual[pair1[0]:pair1[1] + 1]
-    seq2 = individual[pair2[0]:pair2[1] + 1]
-    seq1.reverse()
-    seq2.reverse()
-    return individual[:positions[0]] + seq1 + seq2 + individual[positions[1] + 1:]
+    individual[pair1] = individual[pair1[::-1]]
+    individual[pair2] = individual[pair2[::-1]]
 
+    return removed, tour_edges(individual, changed)
 
-def get_random_positions_based_on_cluster_size(individual, length):
-    positions = [random.randint(0, len(individual) - 1)]
+
+def get_random_positions_based_on_cluster_size(individual, length, rng):
+    positions = [int(rng.integers(len(individual)))]
     if positions[0] + length >= len(individual):
         positions.append(positions[0] - length)
     else:
@@ -274,35 +645,173 @@ def get_random_positions_based_on_cluster_size(individual, length):
     return positions
 
 
-def cyclic(individual, length):
+def cyclic(individual, rng, length=-1):
     mutation_funcs = [scramble, inversion_swap,
                       insertion_mutation, permutation_swap,
                       two_opt_swap]
 
-    func = random.choice(mutation_funcs)
+    func = mutation_funcs[rng.integers(len(mutation_funcs))]
 
-    return func(individual, length)
+    return func(individual, rng, length)
 
 
-def scramble(individual, length=-1):
+def scramble(individual, rng, length=-1):
     """
-    Scrambles a random subset of alleles in a given chromosome.
+    Scrambles a random subset of alleles in a given chromosome, in place.
 
     :param individual: The chromosome
+    :param rng: The random number generator
     :param length: The size of the inversion
-    :return: A mutated copy of the chromosome.
+    :return: The removed and added edges
     """
     # get a start and end point for the scramble
-    positions = get_random_positions_based_on_cluster_size(individual, length)
+    positions = get_random_positions_based_on_cluster_size(individual, length, rng)
+    if not valid_positions(individual, positions):
+        return [], []
 
-    # get the subset of the original individual that corresponds to the points
-    subset = individual[positions[0]:positions[1]]
+    changed = range(positions[0] - 1, positions[1])
+    removed = tour_edges(individual, changed)
 
-    # shuffle the points
-    random.shuffle(subset)
+    # shuffle the subset of the individual that corresponds to the points
+    rng.shuffle(individual[positions[0]:positions[1]])
 
-    # return the mutant
-    return individual[:positions[0]] + subset + individual[positions[1]:]
+    return removed, tour_edges(individual, changed)
+
+
+def get_random_neighbour_positions(individual, neighbours, rng, positions):
+    """
+    Pick a random allele, and one of its candidate neighbours
+
+    :param individual: The chromosome
+    :param neighbours: The candidate neighbours of every city
+    :param positions: The position of every city in the chromosome
+    :return: The positions of the allele and of the neighbour
+    """
+    point1, choice = rng.integers(len(individual)), rng.integers(neighbours.shape[1])
+    neighbour = neighbours[individual[point1], choice]
+
+    return point1, int(positions[neighbour])
+
+
+def update_positions(individual, positions, start, stop):
+    """
+    Update the positions of the cities that a move placed between two points
+
+    :param individual: The chromosome
+    :param positions: The position of every city in the chromosome
+    :param start: The first position that changed
+    :param stop: The last position that changed
+    """
+    positions[individual[start:stop + 1]] = np.arange(start, stop + 1)
+
+
+def nn_inversion(individual, rng, length=-1, neighbours=None, positions=None):
+    """
+    Inverts the subset of alleles between a random allele and one of its
+    candidate neighbours, in place, so that the two become adjacent.
+
+    :param individual: The chromosome
+    :param rng: The random number generator
+    :param length: Not used here, just for compatibility.
+    :param neighbours: The candidate neighbours of every city
+    :param positions: The position of every city in the chromosome, kept up
+                      to date by the move (built here if not given)
+    :return: The removed and added edges
+    """
+    if positions is None:
+        positions = inverse_permutation(individual)
+    point1, point2 = get_random_neighbour_positions(individual, neighbours, rng, positions)
+
+    # Invert the alleles after the first point up to the neighbour, or from
+    # the neighbour up to the allele before the first point.
+    if point2 > point1:
+        start, stop = point1 + 1, point2
+    else:
+        start, stop = point2, point1 - 1
+    if start >= stop:
+        return [], []
+
+    changed = [start - 1, stop]
+    removed = tour_edges(individual, changed)
+
+    individual[start:stop + 1] = individual[start:stop + 1][::-1]
+    update_positions(individual, positions, start, stop)
+
+    return removed, tour_edges(individual, changed)
+
+
+def nn_insertion(individual, rng, length=-1, neighbours=None, positions=None):
+    """
+    Moves one of the candidate neighbours of a random allele right after
+    it, in place.
+
+    :param individual: The chromosome
+    :param rng: The random number generator
+    :param length: Not used here, just for compatibility.
+    :param neighbours: The candidate neighbours of every city
+    :param positions: The position of every city in the chromosome, kept up
+                      to date by the move (built here if not given)
+    :return: The removed and added edges
+    """
+    if positions is None:
+        positions = inverse_permutation(individual)
+    point1, point2 = get_random_neighbour_positions(individual, neighbours, rng, positions)
+    if point2 == point1 + 1:
+        return [], []
+
+    neighbour = individual[point2]
+    if point2 > point1:
+        # The alleles in between shift one position to the right
+        removed = tour_edges(individual, [point1, point2 - 1, point2])
+        individual[point1 + 2:point2 + 1] = individual[point1 + 1:point2]
+        individual[point1 + 1] = neighbour
+        update_positions(individual, positions, point1 + 1, point2)
+        added = tour_edges(individual, [point1, point1 + 1, point2])
+    else:
+        # The alleles in between shift one position to the left
+        removed = tour_edges(individual, [point2 - 1, point2, point1])
+        individual[point2:point1] = individual[point2 + 1:point1 + 1]
+        individual[point1] = neighbour
+        update_positions(individual, positions, point2, point1)
+        added = tour_edges(individual, [point2 - 1, point1 - 1, point1])
+
+    return removed, added
+
+
+def nn_swap(individual, rng, length=-1, neighbours=None, positions=None):
+    """
+    Swaps one of the candidate neighbours of a random allele with the allele
+    right after it, in place.
+
+    :param individual: The chromosome
+    :param rng: The random number generator
+    :param length: Not used here, just for compatibility.
+    :param neighbours: The candidate neighbours of every city
+    :param positions: The position of every city in the chromosome, kept up
+                      to date by the move (built here if not given)
+    :return: The removed and added edges
+    """
+    if positions is None:
+        positions = inverse_permutation(individual)
+    point1, point2 = get_random_neighbour_positions(individual, neighbours, rng, positions)
+    point1 = (point1 + 1) % len(individual)
+    if point1 == point2:
+        return [], []
+
+    changed = [point1 - 1, point1, point2 - 1, point2]
+    removed = tour_edges(individual, changed)
+
+    individual[[point1, point2]] = individual[[point2, point1]]
+    positions[individual[[point1, point2]]] = [point1, point2]
+
+    return removed, tour_edges(individual, changed)
+
+
+def nn_cyclic(individual, rng, length=-1, neighbours=None, positions=None):
+    funcs = [nn_inversion, nn_insertion, nn_swap]
+    func = funcs[rng.integers(len(funcs))]
+
+    return func(individual, rng, length, neighbours=neighbours, positions=positions)
 
 
 MUTATION_FUNCTIONS = {
@@ -312,4 +821,12 @@ MUTATION_FUNCTIONS = {
     "permutation_swap": permutation_swap,
     "two_opt": two_opt_swap,
     "cyclic": cyclic,
+    "nn_inversion": nn_inversion,
+    "nn_insertion": nn_insertion,
+    "nn_swap": nn_swap,
+    "nn_cyclic": nn_cyclic,
 }
+
+# The mutations that pick their second point from the candidate neighbours
+# of the first, and need the 'neighbours' from the global dictionary.
+GUIDED_MUTATION_FUNCTIONS = {"nn_inversion", "nn_insertion", "nn_swap", "nn_cyclic"}
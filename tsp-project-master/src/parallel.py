@@ -0,0 +1,334 @@
+import multiprocessing as mp
+import signal
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import generation
+from .distance import LazyDistanceMatrix
+from .memory import MemoryTracker
+from .population import Population
+from .spatial import GridIndex
+from .utility import die
+
+# The state of a worker process, set up once by init_worker
+_worker = {}
+
+# The statistics the local search stage adds to the parameter dictionary
+LOCAL_SEARCH_STATS = ('ls_moves', 'ls_gain', 'ls_ms')
+
+
+def share_array(array):
+    """
+    Copy an array into a new block of shared memory
+
+    :param array: The array to share
+    :return: The SharedMemory block, and a picklable descriptor for attach_array
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    shared[...] = array
+
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def attach_array(descriptor):
+    """
+    Attach to an array in shared memory
+
+    :param descriptor: The descriptor returned by share_array
+    :return: The SharedMemory block, and a read-only array backed by it
+    """
+    name, shape, dtype = descriptor
+    block = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    array.flags.writeable = False
+
+    return block, array
+
+
+def attach_mapped_array(path, dtype, shape):
+    """
+    Memory-map an array from the .npy file the main process mapped it from
+
+    :param path: The path of the .npy file
+    :param dtype: The data type of the array
+    :param shape: The shape of the array
+    :return: A read-only memory-mapped array
+    """
+    array = np.load(path, mmap_mode='r')
+    if array.shape != tuple(shape) or array.dtype != np.dtype(dtype):
+        die("{} no longer holds the shared {} {} array".format(path, shape, dtype))
+
+    return array
+
+
+def share_instance(args):
+    """
+    Put the instance data (coordinates, distance matrix and candidate
+    neighbours) in shared memory
+
+    A matrix-free distance provider is not copied; workers rebuild it from
+    the shared coordinates instead. Arrays memory-mapped from a cache file
+    are not copied either; workers map the same file, so its pages are
+    shared through the page cache. The spatial index is small, so it is
+    simply pickled once per worker.
+
+    :param args: The global parameter dictionary
+    :return: The SharedMemory blocks, and a picklable descriptor for attach_instance
+    """
+    blocks = []
+    instance = {}
+
+    for key in ('coordinates', 'distance_matrix', 'spatial_index', 'neighbours'):
+        if key not in args:
+            continue
+
+        value = args[key]
+        if isinstance(value, GridIndex):
+            instance[key] = ('object', value)
+            continue
+
+        if isinstance(value, LazyDistanceMatrix):
+            instance[key] = ('lazy', value.dtype.str, value.cache_rows)
+            continue
+
+        if isinstance(value, np.memmap) and value.filename is not None:
+            instance[key] = ('mmap', value.filename, value.dtype.str, value.shape)
+            continue
+
+        block, descriptor = share_array(np.asarray(value))
+        blocks.append(block)
+        instance[key] = ('shared', descriptor)
+
+    return blocks, instance
+
+
+def attach_instance(instance):
+    """
+    Attach to the instance data shared by share_instance
+
+    :param instance: The descriptor returned by share_instance
+    :return: The SharedMemory blocks, and a dictionary with the instance arrays
+    """
+    blocks = []
+    arrays = {}
+
+    for key, descriptor in instance.items():
+        if descriptor[0] == 'shared':
+            block, arrays[key] = attach_array(descriptor[1])
+            blocks.append(block)
+        elif descriptor[0] == 'mmap':
+            arrays[key] = attach_mapped_array(*descriptor[1:])
+
+    for key, descriptor in instance.items():
+        if descriptor[0] == 'lazy':
+            arrays[key] = LazyDistanceMatrix(arrays['coordinates'], descriptor[1], descriptor[2])
+        elif descriptor[0] == 'object':
+            arrays[key] = descriptor[1]
+
+    return blocks, arrays
+
+
+def worker_parameters(args):
+    """
+    Get the algorithm parameters that are passed on to the workers
+
+    :param args: The global parameter dictionary
+    :return: The entries of args that are plain numbers, strings and booleans
+    """
+    return {k: v for k, v in args.items()
+            if v is None or isinstance(v, (bool, int, float, str))}
+
+
+def init_worker(instance, parameters):
+    """
+    Set up a worker process: attach to the shared instance data
+
+    :param instance: The descriptor returned by share_instance
+    :param parameters: The algorithm parameters
+    """
+    # Ctrl-C is handled by the main process, which stops after the current
+    # generation
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    blocks, arrays = attach_instance(instance)
+    _worker['blocks'] = blocks
+    _worker['args'] = dict(parameters, **arrays)
+
+    # Track the memory of the worker's stages. The main process enforces
+    # the budget, from the snapshots the worker sends back with its results.
+    if parameters.get('memory_tracking', False):
+        _worker['args']['memory_tracker'] = MemoryTracker({})
+
+
+def worker_args():
+    """
+    Get the parameter dictionary of the current worker process
+
+    :return: The algorithm parameters and the shared instance data
+    """
+    return _worker['args']
+
+
+def tracked_task(task):
+    """
+    Run a task, and send the memory use of the worker back with its result
+
+    :param task: The function and its argument
+    :return: The result, and the snapshot of the worker's memory tracker
+    """
+    function, argument = task
+    result = function(argument)
+
+    return result, _worker['args']['memory_tracker'].snapshot()
+
+
+def breed_task(task):
+    """
+    Breed, mutate and evaluate the offspring of a share of the mating pairs
+
+    :param task: The parent tours (the best individual first, then the
+                 mating pairs one after the other), their fitness, and the
+                 task's random number generator
+    :return: The offspring tours, their fitness and the local search statistics
+    """
+    tours, fitness, rng = task
+    number_of_offspring = len(tours) - 1
+
+    population = Population(len(tours), number_of_offspring, tours.shape[1])
+    population.tours[:] = tours
+    population.fitness[:] = fitness
+
+    # The best individual is the fittest parent here too, and the mating
+    # pairs are simply the consecutive parents after it.
+    args = dict(_worker['args'])
+    args['rng'] = rng
+    args['population'] = population
+    args['mating_pool'] = np.arange(1, len(tours))
+    args['mp_size'] = number_of_offspring
+    generation.breed(args)
+
+    local_search_stats = {k: args[k] for k in LOCAL_SEARCH_STATS if k in args}
+
+    return population.offspring, population.offspring_fitness, local_search_stats
+
+
+class WorkerPool(object):
+    """
+    A persistent pool of worker processes with shared instance data.
+
+    The coordinates and the distance matrix are copied into shared memory
+    once, and every worker attaches to them when it starts, so they are
+    never pickled per task.
+    """
+
+    def __init__(self, args, workers=None):
+        """
+        Start the worker processes
+
+        :param args: The global parameter dictionary
+        :param workers: The number of worker processes (default: 'workers' in args)
+        """
+        if workers is None:
+            workers = args.get('workers', max(1, mp.cpu_count() // 2))
+
+        self.workers = workers
+        self.blocks, instance = share_instance(args)
+        self.pool = mp.Pool(workers, initializer=init_worker,
+                            initargs=(instance, worker_parameters(args)))
+
+        self.children = 0
+        self.seconds = 0.0
+
+        # The workers track their memory too, if the main process does
+        self.memory_tracker = args.get('memory_tracker')
+
+    def breed(self, args):
+        """
+        Breed, mutate and evaluate the offspring on the workers
+
+        The mating pairs are split into one share per worker. Each worker
+        gets the tours of its parents (and of the best individual, for
+        best-order crossover) and returns only the offspring tours and
+        their fitness.
+
+        :param args: The global parameter dictionary
+        :return: Fills in the population's offspring and their fitness
+        """
+        start = time.perf_counter()
+
+        population = args['population']
+        parents = np.asarray(args['mating_pool'])
+        mp_size = args['mp_size']
+        best = population.best_index()
+
+        # Pair up the mating pool the same way recombination does
+        number_of_pairs = population.offspring_size // 2
+        parent_idx = 2 * np.arange(number_of_pairs) % mp_size
+        pairs = np.stack((parents[parent_idx], parents[(parent_idx + 1) % mp_size]), axis=1)
+
+        # Every task draws from its own independent stream, spawned from the
+        # main generator, so a run is reproducible from 'seed' alone
+        shares = np.array_split(np.arange(number_of_pairs), min(self.workers, number_of_pairs))
+        tasks = []
+        for share, rng in zip(shares, args['rng'].spawn(len(shares))):
+            indices = np.concatenate(([best], pairs[share].ravel()))
+            tasks.append((population.tours[indices], population.fitness[indices], rng))
+
+        # The local search statistics are summed over the workers
+        for k in LOCAL_SEARCH_STATS:
+            args.pop(k, None)
+
+        for share, (tours, fitness, local_search_stats) in zip(shares, self.map(breed_task, tasks)):
+            children = slice(2 * share[0], 2 * share[-1] + 2)
+            population.offspring[children] = tours
+            population.offspring_fitness[children] = fitness
+            for k, v in local_search_stats.items():
+                args[k] = args.get(k, 0) + v
+
+        population.offspring_dirty[:] = False
+
+        self.children += population.offspring_size
+        self.seconds += time.perf_counter() - start
+
+    def map(self, function, tasks):
+        """
+        Run a function on the workers for every task
+
+        :param function: A module-level function; workers can get the
+                         parameters and instance data with worker_args()
+        :param tasks: The arguments of every call
+        :return: An iterator over the results, in the order of the tasks
+        """
+        if self.memory_tracker is None:
+            return self.pool.imap(function, tasks)
+
+        return self.tracked_map(function, tasks)
+
+    def tracked_map(self, function, tasks):
+        """
+        Run a function on the workers for every task, and pass the workers'
+        memory use on to the memory tracker
+
+        :param function: A module-level function
+        :param tasks: The arguments of every call
+        :return: An iterator over the results, in the order of the tasks
+        """
+        for result, snapshot in self.pool.imap(tracked_task, [(function, task) for task in tasks]):
+            self.memory_tracker.add_worker_snapshot(snapshot)
+            yield result
+
+    def close(self):
+        """ Stop the workers, release the shared memory and report the throughput """
+        self.pool.close()
+        self.pool.join()
+
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+        if self.children:
+            print("Worker pool: %d children in %.2f s (%.0f children/s, %d workers)" % (
+                self.children, self.seconds, self.children / self.seconds, self.workers))
@@ -38,7 +38,7 @@ class PlotHelper(object):
         else:
             data = (self.args['time'], self.args['max'],
                     self.args['mean'], self.args['sd'],
-                    self.args['fitness'], self.args['population'],
+                    self.args['population'].fitness, self.args['population'].tours,
                     self.args['dataset'], self.args['current_gen'],
                     self.args['generations'])
             send(data)
@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class Population(object):
+    """
+    Array-backed storage for the population, the offspring and their fitness.
+
+    Parents and offspring live in one contiguous block of rows, parents
+    first, so that mu + lambda survivor selection can rank the block without
+    concatenating anything. Survivors are gathered into a second block of the
+    same size and the two blocks are then swapped (double-buffering), so no
+    arrays are allocated once the algorithm is running.
+    """
+
+    def __init__(self, pop_size, offspring_size, chromosome_length):
+        """
+        Preallocate the tour and fitness arrays
+
+        :param pop_size: The number of parents (mu)
+        :param offspring_size: The number of offspring per generation (lambda)
+        :param chromosome_length: The number of cities in a tour
+        """
+        capacity = pop_size + offspring_size
+        self.pop_size = pop_size
+        self.offspring_size = offspring_size
+        self.chromosome_length = chromosome_length
+        self._tours = [np.zeros((capacity, chromosome_length), dtype=np.int32)
+                       for _ in range(2)]
+        self._fitness = [np.full(capacity, -np.inf, dtype=np.float64)
+                         for _ in range(2)]
+        self._front = 0
+
+        # Offspring whose fitness is not known yet
+        self.offspring_dirty = np.ones(offspring_size, dtype=bool)
+
+    @property
+    def all_tours(self):
+        """ The tours of the parents followed by the offspring """
+        return self._tours[self._front]
+
+    @property
+    def all_fitness(self):
+        """ The fitness of the parents followed by the offspring """
+        return self._fitness[self._front]
+
+    @property
+    def tours(self):
+        """ The tours of the parents """
+        return self.all_tours[:self.pop_size]
+
+    @property
+    def fitness(self):
+        """ The fitness of the parents """
+        return self.all_fitness[:self.pop_size]
+
+    @property
+    def offspring(self):
+        """ The tours of the offspring """
+        return self.all_tours[self.pop_size:]
+
+    @property
+    def offspring_fitness(self):
+        """ The fitness of the offspring """
+        return self.all_fitness[self.pop_size:]
+
+    @property
+    def nbytes(self):
+        """ The memory used by the tour and fitness arrays, both blocks included """
+        return (sum(tours.nbytes for tours in self._tours) + sum(fitness.nbytes for fitness in self._fitness)
+                + self.offspring_dirty.nbytes)
+
+    def __len__(self):
+        return self.pop_size
+
+    def __getitem__(self, index):
+        return self.tours[index]
+
+    def best_index(self):
+        """ The index of the fittest parent """
+        return int(np.argmax(self.fitness))
+
+    def best(self):
+        """ The tour of the fittest parent """
+        return self.tours[self.best_index()]
+
+    def survive(self, indices):
+        """
+        Make the given parents and offspring the parents of the next generation
+
+        :param indices: pop_size row indices into all_tours/all_fitness
+        """
+        back = 1 - self._front
+        np.take(self.all_tours, indices, axis=0, out=self._tours[back][:self.pop_size])
+        np.take(self.all_fitness, indices, out=self._fitness[back][:self.pop_size])
+        self._front = back
+
+
+def offspring_count(mp_size):
+    """
+    Get the number of offspring bred from a mating pool
+
+    Offspring are bred in pairs, so an odd mating pool produces one extra child.
+
+    :param mp_size: The size of the mating pool
+    :return: The number of offspring per generation
+    """
+    return 2 * ((mp_size + 1) // 2)
@@ -0,0 +1,142 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+from array import array
+
+import numpy as np
+
+from .utility import die
+
+# The percentiles of every stage's durations in the report
+PROFILE_PERCENTILES = (50, 90, 99)
+
+# The histogram bins are spaced logarithmically, this many per decade,
+# from 1 microsecond to 100 seconds
+HISTOGRAM_BINS_PER_DECADE = 4
+HISTOGRAM_RANGE = (-6, 2)
+
+# The number of functions listed from the cProfile output
+PROFILE_TOP_FUNCTIONS = 15
+
+
+class Profiler(object):
+    """
+    Collects the duration of every stage, for the whole program.
+
+    telemetry.stage passes every duration to add(), which only appends it
+    to an array, so the profiler can stay on for a complete run. At the end,
+    report() prints percentiles per stage and writes them, with a histogram
+    per stage, to 'profile_report' as JSON.
+
+    If 'profile_generations' is set to [first, last], the generations from
+    first up to (not including) last also run under cProfile, and the
+    statistics are written to 'profile_stats_file'.
+    """
+
+    def __init__(self, args, report_path, stats_path):
+        """
+        Start profiling
+
+        :param args: The global parameter dictionary
+        :param report_path: The default path of the JSON report
+        :param stats_path: The default path of the cProfile statistics
+        """
+        self.report_path = args.get('profile_report', report_path)
+        self.stats_path = args.get('profile_stats_file', stats_path)
+        self.samples = {}
+        self.start = time.perf_counter()
+
+        self.window = args.get('profile_generations')
+        if self.window is not None and (len(self.window) != 2 or self.window[0] >= self.window[1]):
+            die("profile_generations must be [first, last] with first < last")
+        self.cprofile = cProfile.Profile() if self.window is not None else None
+        self.profiled_generations = 0
+
+    def add(self, name, seconds):
+        """
+        Record one duration of a stage
+
+        :param name: The name of the stage
+        :param seconds: The duration
+        """
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = array('d')
+        samples.append(seconds)
+
+    def in_window(self, generation):
+        return self.window is not None and self.window[0] <= generation < self.window[1]
+
+    def begin_generation(self, generation):
+        """
+        Start cProfile if the generation is in the 'profile_generations' window
+
+        :param generation: The number of the generation about to run
+        """
+        if self.in_window(generation):
+            self.cprofile.enable()
+
+    def end_generation(self, generation):
+        """
+        Stop cProfile after a generation in the 'profile_generations' window
+
+        :param generation: The number of the generation that just finished
+        """
+        if self.in_window(generation):
+            self.cprofile.disable()
+            self.profiled_generations += 1
+
+    def stage_stats(self):
+        """
+        Summarize the durations of every stage
+
+        :return: A dictionary per stage, in the order the stages first ran
+        """
+        wall_time = time.perf_counter() - self.start
+        edges = np.logspace(HISTOGRAM_RANGE[0], HISTOGRAM_RANGE[1],
+                            (HISTOGRAM_RANGE[1] - HISTOGRAM_RANGE[0]) * HISTOGRAM_BINS_PER_DECADE + 1)
+
+        stats = {}
+        for name, samples in self.samples.items():
+            seconds = np.frombuffer(samples, dtype=np.float64)
+            percentiles = np.percentile(seconds, PROFILE_PERCENTILES)
+            counts, _ = np.histogram(np.clip(seconds, edges[0], edges[-1]), edges)
+            stats[name] = {
+                'calls': len(seconds),
+                'total': float(seconds.sum()),
+                'share': float(seconds.sum() / wall_time) if wall_time > 0 else 0.0,
+                'mean': float(seconds.mean()),
+                'min': float(seconds.min()),
+                'max': float(seconds.max()),
+                'percentiles': {'p%d' % p: float(v) for p, v in zip(PROFILE_PERCENTILES, percentiles)},
+                'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()},
+            }
+
+        return stats
+
+    def report(self):
+        """ Print the summary table, and write the report and the cProfile statistics """
+        stats = self.stage_stats()
+
+        print("\n%-20s%8s%11s%8s%11s%s%11s" % (
+            "Stage", "Calls", "Total (s)", "Share", "Mean (ms)",
+            "".join("%11s" % ("p%d (ms)" % p) for p in PROFILE_PERCENTILES), "Max (ms)"))
+        for name, stage in stats.items():
+            print("%-20s%8d%11.3f%7.1f%%%11.3f%s%11.3f" % (
+                name, stage['calls'], stage['total'], 100 * stage['share'], 1000 * stage['mean'],
+                "".join("%11.3f" % (1000 * v) for v in stage['percentiles'].values()),
+                1000 * stage['max']))
+
+        with open(self.report_path, 'w') as fp:
+            json.dump({'wall_time': time.perf_counter() - self.start, 'stages': stats}, fp, indent=2)
+        print("Profile report written to %s" % self.report_path)
+
+        if self.profiled_generations:
+            self.cprofile.dump_stats(self.stats_path)
+
+            output = io.StringIO()
+            pstats.Stats(self.cprofile, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+            print("\ncProfile of %d generations (written to %s):" % (self.profiled_generations, self.stats_path))
+            print(output.getvalue())
@@ -0,0 +1,99 @@
+import time
+
+import numpy as np
+
+from . import evaluate, generation, initialize, parallel
+from .telemetry import stage
+
+
+def run_seeds(args, test_runs):
+    """
+    Get a distinct seed for every run
+
+    The seeds are SeedSequences spawned from 'seed' (or from fresh entropy
+    if it is not set), so run i gets the same independent stream however
+    many runs there are and however they are spread over processes.
+
+    :param args: The global parameter dictionary
+    :param test_runs: The number of runs
+    :return: The entropy the seeds were spawned from, and one SeedSequence per run
+    """
+    seed_sequence = np.random.SeedSequence(args.get('seed'))
+
+    return seed_sequence.entropy, seed_sequence.spawn(test_runs)
+
+
+def seed_run(args, seed):
+    """
+    Create the random number generator of a run
+
+    :param args: The global parameter dictionary
+    :param seed: The SeedSequence of the run
+    :return: Sets 'rng', which every operator draws from
+    """
+    args['rng'] = np.random.default_rng(seed)
+
+
+def evolve(args, run_num, start_gen=0, checkpointer=None, telemetry=None, visualize=False):
+    """
+    Run the generations of one run
+
+    :param args: The global parameter dictionary, with an evaluated 'population'
+    :param run_num: The number of the run
+    :param start_gen: The first generation to run
+    :param checkpointer: Writes checkpoints, if given (see checkpoint.Checkpointer)
+    :param telemetry: Records and prints the statistics of every generation,
+                      if given (see telemetry.Telemetry)
+    :param visualize: Whether to plot every generation
+    """
+    if telemetry is not None:
+        telemetry.start_run(run_num)
+    profiler = args.get('profiler')
+
+    for i in range(start_gen, args['generations']):
+        args['current_gen'] = i
+        if profiler is not None:
+            profiler.begin_generation(i)
+        generation.next_generation(args)
+
+        # Plot the current generation. The plotter reads 'max', 'mean' and
+        # 'sd', which telemetry only calculates when it prints them.
+        if visualize:
+            evaluate.calc_stats(args)
+            with stage(args, 'plot'):
+                evaluate.plot(args)
+
+        if profiler is not None:
+            profiler.end_generation(i)
+
+        if telemetry is not None:
+            telemetry.record(args, i)
+
+        # Write a checkpoint if one is due, or stop if asked to
+        if checkpointer is not None:
+            checkpointer.after_generation(args, run_num, i)
+
+
+def run_task(task):
+    """
+    Do one complete run on a worker process
+
+    :param task: The number and the seed of the run
+    :return: The number of the run, the fitness and tour of the best
+             individual, and the run time in seconds
+    """
+    run_num, seed = task
+    start = time.perf_counter()
+
+    args = dict(parallel.worker_args())
+    seed_run(args, seed)
+    with stage(args, 'initial_population'):
+        initialize.gen_population(args)
+    with stage(args, 'initial_evaluation'):
+        evaluate.eval_population(args)
+    evolve(args, run_num)
+
+    population = args['population']
+    best = population.best_index()
+
+    return run_num, population.fitness[best], population.tours[best].copy(), time.perf_counter() - start
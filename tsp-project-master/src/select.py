@@ -1,7 +1,5 @@
 from .utility import *
 
-import random
-
 
 def parents(args):
     """
@@ -10,7 +8,11 @@ def parents(args):
     :param args: The global EA parameter dictionary.
     :return: Adds the mating_pool indices to the parameter dictionary.
     """
-    parent_tournament_selection(args)
+    selection_type = args.get('parent_selection', 'tournament')
+    if selection_type not in PARENT_SELECTION_FUNCTIONS:
+        die("Unknown parent selection type: {}".format(selection_type))
+
+    PARENT_SELECTION_FUNCTIONS[selection_type](args)
 
 
 def parent_tournament_selection(args):
@@ -19,17 +21,97 @@ def parent_tournament_selection(args):
 
     :param args: The global EA parameter dictionary.
     """
-    selected_to_mate = []
-    fitness = list(enumerate(args['fitness']))
+    args['mating_pool'] = batched_tournament(
+        args['population'].fitness, args['mp_size'], args['tournament_size'], args['rng'],
+        args.get('tournament_replacement', False))
+
+
+def rank_tournament_selection(args):
+    """
+    Selects parents using tournaments whose contestants are drawn with
+    linear ranking probabilities, so fitter individuals enter more often.
+
+    :param args: The global EA parameter dictionary.
+    """
+    fitness = args['population'].fitness
+    mu = len(fitness)
+
+    # Linear ranking: the worst individual has rank 0, the best mu - 1.
+    # The selection pressure s is the expected number of tournaments the
+    # best individual enters, relative to the average (1 <= s <= 2).
+    pressure = args.get('selection_pressure', 1.5)
+    ranks = np.empty(mu)
+    ranks[np.argsort(fitness)] = np.arange(mu)
+    probabilities = (2 - pressure) / mu + 2 * ranks * (pressure - 1) / (mu * max(1, mu - 1))
+
+    args['mating_pool'] = batched_tournament(
+        fitness, args['mp_size'], args['tournament_size'], args['rng'],
+        args.get('tournament_replacement', False), p=probabilities)
+
+
+def truncation_tournament_selection(args):
+    """
+    Selects parents using tournaments among the fittest part of the
+    population only.
+
+    :param args: The global EA parameter dictionary.
+    """
+    fitness = args['population'].fitness
+    tournament_size = args['tournament_size']
+
+    # Keep the best 'truncation_ratio' of the population, but always enough
+    # individuals to fill a tournament.
+    number_of_candidates = int(np.ceil(args.get('truncation_ratio', 0.5) * len(fitness)))
+    number_of_candidates = min(len(fitness), max(tournament_size, number_of_candidates))
+    candidates = np.argpartition(-fitness, number_of_candidates - 1)[:number_of_candidates]
+
+    args['mating_pool'] = batched_tournament(
+        fitness, args['mp_size'], tournament_size, args['rng'],
+        args.get('tournament_replacement', False), candidates=candidates)
+
+
+def batched_tournament(fitness, number_of_tournaments, tournament_size, rng,
+                       with_replace=False, candidates=None, p=None):
+    """
+    Runs many tournaments at once.
+
+    All contestants are drawn in one call to the random number generator,
+    and the winner of every tournament is found with a single argmax.
+
+    :param fitness: The fitness of every individual.
+    :param number_of_tournaments: How many winners to select.
+    :param tournament_size: The number of contestants in a tournament.
+    :param rng: The random number generator.
+    :param with_replace: Can an individual enter the same tournament more than once? (Default: False)
+    :param candidates: The indices of the individuals that may enter (Default: all of them)
+    :param p: The probability of drawing each candidate (Default: uniform)
+    :return: An array with the index of every tournament's winner.
+    """
+    if candidates is None:
+        candidates = np.arange(len(fitness))
+    number_of_candidates = len(candidates)
 
-    current_member = 0
-    while current_member < args['mp_size']:
-        random_individuals = random.sample(fitness, args['tournament_size'])
-        best = max(random_individuals, key=lambda arr: arr[1])
-        selected_to_mate.append(best[0])
-        current_member = current_member + 1
+    if with_replace:
+        contestants = rng.choice(
+            number_of_candidates, size=(number_of_tournaments, tournament_size), p=p)
+    else:
+        if tournament_size > number_of_candidates:
+            die("tournament_size is larger than the number of candidates")
 
-    args['mating_pool'] = selected_to_mate
+        # Draw a random key per candidate and tournament, and keep the
+        # tournament_size largest keys. With weights, the keys are
+        # log(u) / p (Efraimidis-Spirakis weighted sampling); candidates with
+        # p == 0 get the key -inf, so they only enter when they must.
+        keys = rng.random((number_of_tournaments, number_of_candidates))
+        if p is not None:
+            p = np.broadcast_to(p, keys.shape)
+            keys = np.divide(np.log(keys), p, out=np.full_like(keys, -np.inf), where=p > 0)
+        contestants = np.argpartition(-keys, tournament_size - 1, axis=1)[:, :tournament_size]
+
+    contestants = candidates[contestants]
+    winners = np.argmax(fitness[contestants], axis=1)
+
+    return contestants[np.arange(number_of_tournaments), winners]
 
 
 def survivors(args):
@@ -37,7 +119,7 @@ def survivors(args):
     Selects survivors in the population.
 
     :param args: The global EA parameter dictionary.
-    :return: Reassigns 'population' and 'fitness' in the dictionary
+    :return: Replaces the parents of the population with the survivors
     """
     mu_plus_lambda_survivor_selection(args)
 
@@ -46,30 +128,98 @@ def mu_plus_lambda_survivor_selection(args):
     """
     Select survivors using mu + lambda selection.
 
+    The best mu of the parents and offspring are found with a partial sort.
+    If 'survivor_dedup' is set, copies of the same tour (in any rotation or
+    direction) only survive once, unless there are not enough distinct tours
+    to fill the population.
+
     :param args: The global EA parameter dictionary.
     """
-    full_population = args['population'] + args['offspring']
-    full_fitness = args['fitness'] + args['offspring_fitness']
-    mu = args['pop_size']
+    population = args['population']
+    fitness = population.all_fitness
+    mu = population.pop_size
+    candidates = np.arange(len(fitness))
 
-    rank_vector = rankify(full_fitness)[:mu]
-    population, fitness = [], []
+    if args.get('survivor_dedup', False):
+        distinct = distinct_tours(population.all_tours, fitness)
+        duplicates = np.flatnonzero(~distinct)
+        candidates = np.flatnonzero(distinct)
 
-    for index in rank_vector:
-        population.append(full_population[index])
-        fitness.append(full_fitness[index])
+        # Fill up with the best duplicates if too few tours are distinct
+        missing = mu - len(candidates)
+        if missing > 0:
+            refill = duplicates[best_indices(fitness[duplicates], missing)]
+            candidates = np.concatenate((candidates, refill))
 
-    args['population'] = population
-    args['fitness'] = fitness
+        args['duplicates_dropped'] = len(duplicates) - max(0, missing)
 
+    survivors = candidates[best_indices(fitness[candidates], mu)]
+    population.survive(survivors)
+
+
+def best_indices(fitness, number_to_choose):
+    """
+    Returns the indices of the fittest values, in no particular order.
 
-def random_selection(individuals, number_to_choose, with_replace=False):
+    :param fitness: The fitness values.
+    :param number_to_choose: How many indices to return.
+    :return: The indices of the number_to_choose largest fitness values.
+    """
+    if number_to_choose >= len(fitness):
+        return np.arange(len(fitness))
+
+    return np.argpartition(-fitness, number_to_choose - 1)[:number_to_choose]
+
+
+def distinct_tours(tours, fitness):
+    """
+    Flags the first copy of every distinct tour.
+
+    Only tours whose fitness is (nearly) equal to another tour's can be
+    copies of each other, so only those are compared, by their canonical
+    form.
+
+    :param tours: The tours, one per row.
+    :param fitness: The fitness of every tour.
+    :return: A boolean array, False for tours that repeat an earlier one.
+    """
+    distinct = np.ones(len(fitness), dtype=bool)
+
+    # Incremental fitness updates can differ from a full evaluation in the
+    # last bits, so compare with a small relative tolerance.
+    order = np.argsort(fitness)
+    sorted_fitness = fitness[order]
+    close = np.abs(np.diff(sorted_fitness)) <= 1e-9 * np.abs(sorted_fitness[1:])
+    suspects = np.zeros(len(fitness), dtype=bool)
+    suspects[order[1:][close]] = True
+    suspects[order[:-1][close]] = True
+
+    seen = set()
+    for index in np.flatnonzero(suspects):
+        key = canonical_tour_key(tours[index])
+        if key in seen:
+            distinct[index] = False
+        else:
+            seen.add(key)
+
+    return distinct
+
+
+def random_selection(individuals, number_to_choose, rng, with_replace=False):
     """
     Returns a random sample from a set, with or without replacement
 
     :param individuals: The individuals to choose from.
     :param number_to_choose: The size of the sample.
+    :param rng: The random number generator.
     :param with_replace: Pick with replacement? (Default: False)
     :return: The random sample
     """
-    return np.random.choice(individuals, size=number_to_choose, replace=with_replace)
+    return rng.choice(individuals, size=number_to_choose, replace=with_replace)
+
+
+PARENT_SELECTION_FUNCTIONS = {
+    "tournament": parent_tournament_selection,
+    "rank_tournament": rank_tournament_selection,
+    "truncation_tournament": truncation_tournament_selection,
+}
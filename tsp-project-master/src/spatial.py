@@ -0,0 +1,258 @@
+import numpy as np
+
+# The grid is sized so that every cell holds about this many points
+POINTS_PER_CELL = 2.0
+
+# Upper bound on the number of candidate points looked at in one batch of
+# queries, so that the temporary memory stays bounded.
+SPATIAL_BLOCK_ELEMENTS = 1 << 20
+
+
+class GridIndex(object):
+    """
+    Uniform grid over a set of 2-D points.
+
+    The points are bucketed into square cells, and stored cell by cell.
+    A query only looks at the cells around the query point, so a batch of
+    k-nearest or radius queries takes about O(k) work per query instead of
+    a scan over all N points.
+    """
+
+    def __init__(self, points, points_per_cell=POINTS_PER_CELL):
+        """
+        Build the index
+
+        :param points: An N x 2 array of point coordinates
+        :param points_per_cell: The average number of points per cell
+        """
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        number_of_points = len(self.points)
+
+        lower = self.points.min(axis=0) if number_of_points else np.zeros(2)
+        upper = self.points.max(axis=0) if number_of_points else np.zeros(2)
+        extent = upper - lower
+
+        # Square cells, with about points_per_cell points in each. Clustered
+        # or degenerate (collinear, coincident) point sets still get a
+        # positive cell size.
+        area = max(extent[0] * extent[1], np.max(extent) ** 2 / max(1, number_of_points))
+        cell_size = np.sqrt(area * points_per_cell / max(1, number_of_points))
+        if not cell_size > 0:
+            cell_size = 1.0
+
+        shape = np.floor(extent / cell_size).astype(np.intp) + 1
+        cells = self.cell_ids(self.cells_of(self.points, lower, cell_size, shape), shape)
+        order = np.argsort(cells, kind='stable')
+        cell_start = np.searchsorted(cells[order], np.arange(shape[0] * shape[1] + 1))
+
+        self._set_arrays(lower, cell_size, shape, order, cell_start)
+
+    def _set_arrays(self, origin, cell_size, shape, order, cell_start):
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.cell_size = float(cell_size)
+        self.shape = tuple(int(s) for s in shape)
+        self.order = np.asarray(order, dtype=np.intp)
+        self.cell_start = np.asarray(cell_start, dtype=np.intp)
+        self.points_per_cell = max(1.0, len(self.points) / (len(self.cell_start) - 1))
+
+    def __len__(self):
+        return len(self.points)
+
+    def arrays(self):
+        """
+        Get the arrays that make up the index, to store it in a cache file
+
+        :return: A dictionary of arrays, for from_arrays
+        """
+        return {'origin': self.origin,
+                'cell_size': np.array(self.cell_size),
+                'shape': np.array(self.shape),
+                'order': self.order,
+                'cell_start': self.cell_start}
+
+    @classmethod
+    def from_arrays(cls, points, arrays):
+        """
+        Restore an index from the arrays returned by arrays()
+
+        :param points: The N x 2 array of point coordinates the index was built on
+        :param arrays: The dictionary of arrays
+        :return: The index
+        :raises ValueError: If the arrays do not describe an index over the points
+        """
+        index = cls.__new__(cls)
+        index.points = np.ascontiguousarray(points, dtype=np.float64)
+        index._set_arrays(arrays['origin'], arrays['cell_size'], arrays['shape'],
+                          arrays['order'], arrays['cell_start'])
+
+        number_of_cells = index.shape[0] * index.shape[1]
+        if (len(index.order) != len(index.points) or len(index.cell_start) != number_of_cells + 1
+                or index.cell_start[-1] != len(index.points)):
+            raise ValueError("the spatial index does not match the points")
+
+        return index
+
+    @staticmethod
+    def cells_of(points, origin, cell_size, shape):
+        """
+        Find the grid cell of every point, clipped to the grid
+
+        :return: A Q x 2 array of cell coordinates
+        """
+        cells = np.floor((points - origin) / cell_size).astype(np.intp)
+        return np.clip(cells, 0, np.asarray(shape) - 1)
+
+    @staticmethod
+    def cell_ids(cells, shape):
+        """ Convert Q x 2 cell coordinates to flat cell numbers """
+        return cells[:, 0] * shape[1] + cells[:, 1]
+
+    def window(self, points, cells, width):
+        """
+        Collect the points in the square of cells around every query
+
+        :param points: A Q x 2 array of query coordinates
+        :param cells: The Q x 2 cell coordinates of the queries
+        :param width: How many cells to look at on every side of the query's cell
+        :return: The query and point index of every candidate, and the radius
+                 around every query in which the window is guaranteed to
+                 contain all the points
+        """
+        offsets = np.arange(-width, width + 1)
+        x = cells[:, 0, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis]
+        y = cells[:, 1, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :]
+        inside = (x >= 0) & (x < self.shape[0]) & (y >= 0) & (y < self.shape[1])
+        ids = np.where(inside, x * self.shape[1] + y, 0).reshape(len(cells), -1)
+        inside = inside.reshape(len(cells), -1)
+
+        starts = self.cell_start[ids]
+        counts = np.where(inside, self.cell_start[ids + 1] - starts, 0).ravel()
+
+        # Expand every cell into the run of points stored in it
+        total = counts.sum()
+        run_offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates = self.order[np.repeat(starts.ravel(), counts) + run_offsets]
+        queries = np.repeat(np.arange(len(cells)), counts.reshape(len(cells), -1).sum(axis=1))
+
+        # Distance from the query to the border of its window. Beyond the
+        # edge of the grid there are no points, so those sides do not count.
+        low = self.origin + (cells - width) * self.cell_size
+        high = self.origin + (cells + width + 1) * self.cell_size
+        to_low = np.where(cells - width > 0, points - low, np.inf)
+        to_high = np.where(cells + width + 1 < np.asarray(self.shape), high - points, np.inf)
+        radius = np.minimum(to_low, to_high).min(axis=1)
+
+        return queries, candidates, radius
+
+    def knn(self, points, k, exclude=None):
+        """
+        Find the k nearest indexed points of every query point
+
+        :param points: A Q x 2 array of query coordinates
+        :param k: The number of neighbours
+        :param exclude: Optionally, one point index per query that is never
+                        returned (e.g. the query city itself)
+        :return: Q x k arrays of point indices and distances, nearest first
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        k = min(k, len(self) - (exclude is not None))
+        indices = np.empty((len(points), max(0, k)), dtype=np.intp)
+        distances = np.empty((len(points), max(0, k)))
+        if k <= 0 or len(points) == 0:
+            return indices, distances
+
+        cells = self.cells_of(points, self.origin, self.cell_size, self.shape)
+
+        # Start with a window that holds about k points, and widen it for
+        # the queries whose k-th neighbour could lie outside of it.
+        width = max(1, int(np.ceil((np.sqrt((k + 1) / self.points_per_cell) - 1) / 2)))
+        pending = np.arange(len(points))
+        while len(pending):
+            block = max(1, int(SPATIAL_BLOCK_ELEMENTS // ((2 * width + 1) ** 2 * self.points_per_cell)))
+            retry = []
+            for start in range(0, len(pending), block):
+                batch = pending[start:start + block]
+                queries, candidates, radius = self.window(points[batch], cells[batch], width)
+                delta = self.points[candidates] - points[batch][queries]
+                candidate_distances = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+                if exclude is not None:
+                    candidate_distances[candidates == exclude[batch][queries]] = np.inf
+
+                # Lay the candidates out as one padded row per query
+                counts = np.bincount(queries, minlength=len(batch))
+                columns = np.arange(len(queries)) - np.repeat(np.cumsum(counts) - counts, counts)
+                padded = np.full((len(batch), max(k, counts.max())), np.inf)
+                padded[queries, columns] = candidate_distances
+                padded_candidates = np.zeros(padded.shape, dtype=np.intp)
+                padded_candidates[queries, columns] = candidates
+
+                nearest = np.argpartition(padded, k - 1, axis=1)[:, :k]
+                nearest_distances = np.take_along_axis(padded, nearest, axis=1)
+                by_distance = np.argsort(nearest_distances, axis=1, kind='stable')
+                nearest = np.take_along_axis(nearest, by_distance, axis=1)
+                nearest_distances = np.take_along_axis(nearest_distances, by_distance, axis=1)
+
+                done = nearest_distances[:, -1] <= radius
+                indices[batch[done]] = np.take_along_axis(padded_candidates, nearest, axis=1)[done]
+                distances[batch[done]] = nearest_distances[done]
+                retry.append(batch[~done])
+
+            pending = np.concatenate(retry)
+            width *= 2
+
+        return indices, distances
+
+    def radius(self, points, radius, exclude=None):
+        """
+        Find the indexed points within a distance of every query point
+
+        :param points: A Q x 2 array of query coordinates
+        :param radius: The search radius
+        :param exclude: Optionally, one point index per query that is never returned
+        :return: A list with an array of point indices per query, nearest first
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        cells = self.cells_of(points, self.origin, self.cell_size, self.shape)
+        width = max(0, int(np.ceil(radius / self.cell_size)))
+        block = max(1, int(SPATIAL_BLOCK_ELEMENTS // ((2 * width + 1) ** 2 * self.points_per_cell)))
+
+        neighbours = []
+        for start in range(0, len(points), block):
+            batch = np.arange(start, min(start + block, len(points)))
+            queries, candidates, _ = self.window(points[batch], cells[batch], width)
+            delta = self.points[candidates] - points[batch][queries]
+            candidate_distances = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+
+            keep = candidate_distances <= radius
+            if exclude is not None:
+                keep &= candidates != exclude[batch][queries]
+            queries, candidates, candidate_distances = queries[keep], candidates[keep], candidate_distances[keep]
+
+            # Group by query, nearest first
+            order = np.lexsort((candidate_distances, queries))
+            bounds = np.searchsorted(queries[order], np.arange(1, len(batch)))
+            neighbours.extend(np.split(candidates[order], bounds))
+
+        return neighbours
+
+    def nearest_cities(self, cities, k):
+        """
+        Find the k nearest other cities of every given city
+
+        :param cities: An array of city indices (of the indexed points)
+        :param k: The number of neighbours
+        :return: len(cities) x k arrays of city indices and distances, nearest first
+        """
+        cities = np.asarray(cities, dtype=np.intp).reshape(-1)
+        return self.knn(self.points[cities], k, exclude=cities)
+
+    def cities_within(self, cities, radius):
+        """
+        Find the other cities within a distance of every given city
+
+        :param cities: An array of city indices (of the indexed points)
+        :param radius: The search radius
+        :return: A list with an array of city indices per city, nearest first
+        """
+        cities = np.asarray(cities, dtype=np.intp).reshape(-1)
+        return self.radius(self.points[cities], radius, exclude=cities)
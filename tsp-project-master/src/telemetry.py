@@ -0,0 +1,201 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from . import evaluate
+from .utility import die
+
+# The stages of a generation that are timed separately. 'breeding' is the
+# whole offspring pipeline when it runs on the worker pool.
+STAGES = ('parent_selection', 'recombination', 'mutation', 'local_search', 'evaluation',
+          'breeding', 'survivor_selection', 'plot')
+
+# The layout of one telemetry record in the ring buffer and the binary log
+RECORD_DTYPE = np.dtype([
+    ('run', '<i4'),
+    ('generation', '<i4'),
+    ('seconds', '<f8'),
+    ('best', '<f8'),
+    ('mean', '<f8'),
+    ('sd', '<f8'),
+    ('evaluations_per_second', '<f8'),
+    ('improvement', '<f8'),
+    ('duplicates_dropped', '<i4'),
+] + [(stage + '_seconds', '<f8') for stage in STAGES])
+
+TELEMETRY_FORMATS = ('jsonl', 'binary')
+
+# The first line of a binary log; the second line is the JSON record layout
+TELEMETRY_MAGIC = b"TSP-TELEMETRY 1\n"
+
+
+@contextmanager
+def stage(args, name):
+    """
+    Time a stage of a generation
+
+    :param args: The global parameter dictionary
+    :param name: The name of the stage; only STAGES are recorded as telemetry
+    :return: Adds the time spent to 'stage_seconds'[name], and passes it to
+             the 'profiler', if there is one; the 'memory_tracker', if there
+             is one, measures the memory use of the stage
+    """
+    memory_tracker = args.get('memory_tracker')
+    if memory_tracker is not None:
+        memory_start = memory_tracker.begin_stage()
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if memory_tracker is not None:
+            memory_tracker.end_stage(name, memory_start)
+        stage_seconds = args.setdefault('stage_seconds', {})
+        stage_seconds[name] = stage_seconds.get(name, 0.0) + seconds
+
+        profiler = args.get('profiler')
+        if profiler is not None:
+            profiler.add(name, seconds)
+
+
+def load_telemetry(path):
+    """
+    Read a binary telemetry log
+
+    :param path: The path of the log
+    :return: A structured array with one record per generation
+    """
+    with open(path, 'rb') as fp:
+        if fp.readline() != TELEMETRY_MAGIC:
+            die("{} is not a binary telemetry log.".format(path))
+        dtype = np.dtype([tuple(field) for field in json.loads(fp.readline())])
+        return np.frombuffer(fp.read(), dtype=dtype)
+
+
+class Telemetry(object):
+    """
+    Records the statistics of every generation in a ring buffer.
+
+    The buffer is written to 'telemetry_file' in batches of
+    'telemetry_buffer' records, as JSON lines or as a binary log
+    ('telemetry_format'). Without a file, the buffer just wraps around.
+    The console shows every 'console_interval'-th generation, and every
+    generation that improves the best tour if 'console_on_improvement' is
+    set; in quiet mode it shows none.
+    """
+
+    def __init__(self, args, quiet=False, append=False, label="Generation"):
+        """
+        Set up the telemetry, and truncate the log file unless appending
+
+        :param args: The global parameter dictionary
+        :param quiet: Whether to print no generations at all
+        :param append: Whether to add to an existing log (when resuming)
+        :param label: What the console lines start with, before the generation number
+        """
+        self.label = label
+        self.path = args.get('telemetry_file')
+        self.format = args.get('telemetry_format', 'jsonl')
+        if self.format not in TELEMETRY_FORMATS:
+            die("telemetry_format must be one of: %s" % ", ".join(TELEMETRY_FORMATS))
+
+        self.records = np.zeros(max(1, args.get('telemetry_buffer', 256)), dtype=RECORD_DTYPE)
+        self.next = 0
+        self.pending = 0
+
+        self.quiet = quiet or args.get('quiet', False)
+        self.console_interval = max(1, args.get('console_interval', 1))
+        self.console_on_improvement = args.get('console_on_improvement', False)
+
+        if self.path is not None and not (append and os.path.isfile(self.path)):
+            open(self.path, 'wb').close()
+
+        self.start_run(0)
+
+    def start_run(self, run_num):
+        """
+        Reset the per-run state before the first generation of a run
+
+        :param run_num: The number of the run
+        """
+        self.run_num = run_num
+        self.best = None
+        self.run_start = self.last_time = time.perf_counter()
+
+    def record(self, args, generation):
+        """
+        Record the statistics of a generation, and print them if sampled
+
+        :param args: The global parameter dictionary
+        :param generation: The number of the generation that just finished
+        :return: Clears 'stage_seconds'
+        """
+        now = time.perf_counter()
+        seconds = now - self.last_time
+
+        population = args['population']
+        lengths = -population.fitness
+        best = lengths.min()
+        improvement = 0.0
+        if self.best is not None and self.best > 0:
+            improvement = (self.best - best) / self.best
+
+        record = self.records[self.next]
+        record['run'] = self.run_num
+        record['generation'] = generation
+        record['seconds'] = now - self.run_start
+        record['best'] = best
+        record['mean'] = lengths.mean()
+        record['sd'] = lengths.std()
+        record['evaluations_per_second'] = population.offspring_size / seconds if seconds > 0 else 0.0
+        record['improvement'] = improvement
+        record['duplicates_dropped'] = args.get('duplicates_dropped', 0)
+        stage_seconds = args.pop('stage_seconds', {})
+        for name in STAGES:
+            record[name + '_seconds'] = stage_seconds.get(name, 0.0)
+
+        self.next = (self.next + 1) % len(self.records)
+        if self.path is not None:
+            self.pending += 1
+            if self.pending == len(self.records):
+                self.flush()
+
+        improved = self.best is None or best < self.best
+        self.best = best if self.best is None else min(self.best, best)
+
+        if not self.quiet and ((generation + 1) % self.console_interval == 0
+                               or (self.console_on_improvement and improved)):
+            # One write per line, so the lines of concurrent islands stay whole
+            sys.stdout.write("%s %d: %s\n" % (self.label, generation, evaluate.format_stats(args)))
+
+        self.last_time = time.perf_counter()
+
+    def flush(self):
+        """ Append the records that have not been written yet to the log """
+        if self.path is None or not self.pending:
+            return
+
+        order = (self.next - self.pending + np.arange(self.pending)) % len(self.records)
+        records = self.records[order]
+
+        with open(self.path, 'ab') as fp:
+            if self.format == 'binary':
+                if fp.tell() == 0:
+                    fp.write(TELEMETRY_MAGIC)
+                    fp.write(json.dumps(RECORD_DTYPE.descr).encode() + b"\n")
+                records.tofile(fp)
+            else:
+                names = RECORD_DTYPE.names
+                lines = (json.dumps(dict(zip(names, row))) for row in records.tolist())
+                fp.write("".join(line + "\n" for line in lines).encode())
+
+        self.pending = 0
+
+    def close(self):
+        """ Write the remaining records """
+        self.flush()
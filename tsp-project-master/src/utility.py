@@ -1,30 +1,23 @@
 import json
 import os
 import sys
-import time
 
 import argparse
 
 import numpy as np
 
 
-def order_subset_from_full_set(subset, full_set):
+def inverse_permutation(tour):
     """
-    Arranges a subset in an order defined by another set
+    Get the position of every city in a tour
 
-    :param subset: A list containing the elements we wish to order
-    :param full_set: A superset of subset, from which we wish to extract order information
-    :return: subset, with the order from full_set
+    :param tour: A permutation of the cities
+    :return: An array where positions[city] is the index of city in tour
     """
-    new_order = subset[:]
+    positions = np.empty(len(tour), dtype=np.intp)
+    positions[tour] = np.arange(len(tour))
 
-    j = 0
-    for i in range(len(full_set)):
-        if full_set[i] in subset:
-            new_order[j] = full_set[i]
-            j += 1
-
-    return new_order
+    return positions
 
 
 def load_params_from_file(filename):
@@ -60,6 +53,11 @@ def parse_args():
                         help=('Number of times to run the algorithm. Used in conjunction '
                               'with --export-data'))
 
+    parser.add_argument('--jobs', '-j',
+                        type=int, default=1,
+                        metavar='J',
+                        help='Number of test runs to do concurrently, in separate processes.')
+
     parser.add_argument('--export', '-e',
                         action='store_true',
                         default=False,
@@ -70,53 +68,30 @@ def parse_args():
                         default=False,
                         help='Whether to visualize the data in real-time')
 
-    parser.add_argument('--debug', '-d',
+    parser.add_argument('--resume', '-r',
                         action='store_true',
                         default=False,
-                        help='Turn on performance analytics and debugging output.')
-
-    return parser.parse_args()
-
-
-def print_performance_metrics(args):
-    """
-    Prints performance metrics for various parts of the EA.
-
-    :param args: A dictionary with the EA parameters, what check_args() returns.
-    """
-    with CodeTimer('read datafile'):
-        from src import data_import
-        data_import.parse_datafile(args)
-
-    with CodeTimer('calculate distance matrix'):
-        data_import.calc_distance_matrix(args)
-
-    with CodeTimer('generate starter population'):
-        from src import initialize
-        initialize.gen_population(args)
-
-    with CodeTimer('initial eval time'):
-        from src import evaluate
-        evaluate.eval_population(args)
-
-    with CodeTimer('parent selection'):
-        from src import select
-        select.parents(args)
+                        help=('Continue the run saved in the checkpoint file '
+                              "('checkpoint_file', or the args file with .checkpoint.npz)."))
 
-    with CodeTimer('recombination'):
-        from src import offspring_generation
-        offspring_generation.recombination(args)
+    parser.add_argument('--quiet', '-q',
+                        action='store_true',
+                        default=False,
+                        help='Do not print the statistics of every generation.')
 
-    with CodeTimer('mutation'):
-        offspring_generation.mutation(args)
+    parser.add_argument('--debug', '-d',
+                        action='store_true',
+                        default=False,
+                        help=('Profile every stage of the EA for the whole run, and report '
+                              'the timings at the end.'))
 
-    with CodeTimer('offspring_fitness'):
-        evaluate.eval_offspring(args)
+    parser.add_argument('--memory', '-m',
+                        action='store_true',
+                        default=False,
+                        help=('Track the memory use of every stage and worker process, and '
+                              "report it at the end (see also 'memory_budget_mb')."))
 
-    with CodeTimer('survivor selection'):
-        select.survivors(args)
-    print("Done evaluating performance")
-    raise SystemExit
+    return parser.parse_args()
 
 
 def print_config(args):
@@ -129,7 +104,9 @@ def print_config(args):
 
     print("\nRuntime parameters:")
     for k, v in sorted(args.items()):
-        if k == "dataset" or k == "distance_matrix":
+        if k in ("dataset", "coordinates", "distance_matrix", "spatial_index",
+                 "neighbours", "rng", "profiler", "memory_tracker",
+                 "stage_seconds"):
             continue
         print("\t'%s': %s" % (str(k), str(v)))
     print()
@@ -145,6 +122,35 @@ def rankify(values):
     return np.argsort(np.array(values))[::-1]
 
 
+def canonical_tour(tour):
+    """
+    Get the canonical form of a tour
+
+    The tour is rotated to start at city 0 and oriented so that the second
+    city is smaller than the last one, so every rotation and direction of the
+    same cycle has the same canonical form.
+
+    :param tour: A permutation of the cities
+    :return: A new array with the canonical form of the tour
+    """
+    tour = np.asarray(tour)
+    canonical = np.roll(tour, -int(np.flatnonzero(tour == 0)[0]))
+    if len(canonical) > 2 and canonical[1] > canonical[-1]:
+        canonical[1:] = canonical[1:][::-1]
+
+    return canonical
+
+
+def canonical_tour_key(tour):
+    """
+    Get a hashable key that identifies a tour regardless of rotation and direction
+
+    :param tour: A permutation of the cities
+    :return: The bytes of the canonical form of the tour
+    """
+    return canonical_tour(tour).tobytes()
+
+
 def die(error):
     """
     Helper function to die on error
@@ -157,17 +163,3 @@ def die(error):
     print("Usage: python3.5 " + str(sys.argv[0]) +
           " args-file-json (optional)")
     raise SystemExit
-
-# CodeTimer derived from
-# https://stackoverflow.com/questions/14452145/how-to-measure-time-taken-between-lines-of-code-in-python
-# used to time each block, for profiling purposes
-class CodeTimer:
-    def __init__(self, name=None):
-        self.name = "'" + name + "'" if name else ''
-
-    def __enter__(self):
-        self.start = time.perf_counter()
-
-    def __exit__(self, exc_type, exc_value, traceback):
-        self.took = (time.perf_counter() - self.start) * 1000.0
-        print("%s: %.2f ms" % (self.name, self.took))
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import data_import, evaluate, initialize  # noqa: E402
+from src.spatial import GridIndex  # noqa: E402
+
+
+def build_args(number_of_cities=30, seed=0, **parameters):
+    """
+    Build a parameter dictionary for a random instance, without touching
+    the data files or their caches
+
+    :param number_of_cities: The number of cities
+    :param seed: The seed of the instance and of 'rng'
+    :param parameters: Parameters that replace the defaults
+    :return: The parameter dictionary, with an evaluated population
+    """
+    rng = np.random.default_rng(seed)
+    coordinates = rng.uniform(0, 1000, (number_of_cities, 2))
+
+    args = {
+        'pop_size': 10,
+        'initialize_method': 'random',
+        'mp_size': 6,
+        'tournament_size': 3,
+        'recombination': 'best_order',
+        'mutation': 'cyclic',
+        'crossover_rate': 0.9,
+        'mutation_rate': 0.8,
+        'generations': 1,
+        'box_cutting_points_n': 10,
+        'kca_k': 0.3,
+        'kca_iterations': 2,
+    }
+    args.update(parameters)
+
+    args['dataset'] = {i: tuple(xy) for i, xy in enumerate(coordinates.tolist())}
+    args['coordinates'] = coordinates
+    args['distance_matrix'] = data_import.build_distance_matrix(coordinates)
+    args['spatial_index'] = GridIndex(coordinates)
+    args['neighbours'] = args['spatial_index'].nearest_cities(
+        np.arange(number_of_cities), min(8, number_of_cities - 1))[0].astype(np.int32)
+    args['rng'] = rng
+
+    initialize.gen_population(args)
+    evaluate.eval_population(args)
+
+    return args
+
+
+@pytest.fixture
+def args():
+    return build_args()
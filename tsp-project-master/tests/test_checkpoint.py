@@ -0,0 +1,64 @@
+import signal
+
+import numpy as np
+import pytest
+
+from src import checkpoint
+
+from conftest import build_args
+
+
+def checkpoint_args(**parameters):
+    args = build_args(**parameters)
+    args['datafile'] = 'data/random.txt'
+    args['datafile_digest'] = 'random'
+
+    return args
+
+
+def test_resume_restores_the_population_and_rng(tmp_path):
+    path = str(tmp_path / 'run.checkpoint.npz')
+    args = checkpoint_args()
+    checkpoint.save_checkpoint(args, path, 0, 5)
+
+    resumed = checkpoint_args(generations=10)
+    assert checkpoint.load_checkpoint(resumed, path) == (0, 5)
+    assert np.array_equal(resumed['population'].tours, args['population'].tours)
+    assert resumed['rng'].random() == args['rng'].random()
+
+
+@pytest.mark.parametrize('parameter, value', [
+    ('datafile', 'data/other.txt'),
+    ('pop_size', 12),
+    ('mutation', 'scramble'),
+    ('parent_selection', 'rank_tournament'),
+])
+def test_resume_with_different_parameters_stops(tmp_path, parameter, value):
+    path = str(tmp_path / 'run.checkpoint.npz')
+    checkpoint.save_checkpoint(checkpoint_args(), path, 0, 5)
+
+    resumed = checkpoint_args()
+    resumed[parameter] = value
+    with pytest.raises(SystemExit):
+        checkpoint.load_checkpoint(resumed, path)
+
+
+@pytest.mark.parametrize('parameters, enabled', [
+    ({}, False),
+    ({'checkpoint_interval': 0}, False),
+    ({'checkpoint_interval': 100}, True),
+    ({'checkpoint_seconds': 60}, True),
+    ({'checkpoint_file': 'run.checkpoint.npz'}, True),
+])
+def test_checkpointing_is_enabled_by_its_parameters(parameters, enabled):
+    assert checkpoint.Checkpointer(parameters, 'run.checkpoint.npz').enabled == enabled
+
+
+def test_signal_handlers_are_restored():
+    previous = signal.getsignal(signal.SIGTERM)
+    checkpointer = checkpoint.Checkpointer({'checkpoint_interval': 100}, 'run.checkpoint.npz')
+
+    checkpointer.install_signal_handlers()
+    assert signal.getsignal(signal.SIGTERM) == checkpointer.handle_signal
+    checkpointer.restore_signal_handlers()
+    assert signal.getsignal(signal.SIGTERM) == previous
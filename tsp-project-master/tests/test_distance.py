@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from src import data_import
+from src.distance import LazyDistanceMatrix
+
+
+@pytest.fixture
+def coordinates():
+    return np.random.default_rng(0).uniform(0, 1000, (40, 2))
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_indexing_matches_the_dense_matrix(coordinates, dtype):
+    dense = data_import.build_distance_matrix(coordinates, dtype)
+    lazy = LazyDistanceMatrix(coordinates, dtype)
+    cities1 = np.array([[0, 5, 39], [7, 7, 2]])
+    cities2 = np.array([[1, 5, 0], [39, 8, 3]])
+
+    assert lazy.shape == dense.shape and len(lazy) == len(dense)
+    assert lazy[3].dtype == dtype
+    assert np.allclose(lazy[3], dense[3])
+    assert np.allclose(lazy[3][17], dense[3][17])
+    assert np.allclose(lazy[3, 17], dense[3, 17])
+    assert np.ndim(lazy[3, 17]) == 0
+    assert np.allclose(lazy[cities1, cities2], dense[cities1, cities2])
+    assert np.allclose(lazy[cities1[0], 4], dense[cities1[0], 4])
+    assert np.allclose(lazy[2:6], dense[2:6])
+    assert np.allclose(lazy[cities1], dense[cities1])
+    with pytest.raises(IndexError):
+        lazy[1, 2, 3]
+
+
+def test_rows_are_read_only(coordinates):
+    row = LazyDistanceMatrix(coordinates)[3]
+
+    with pytest.raises(ValueError):
+        row[0] = 1.0
+
+
+def test_least_recently_used_rows_are_evicted(coordinates):
+    lazy = LazyDistanceMatrix(coordinates, cache_rows=2)
+
+    first = lazy[0]
+    lazy[1]
+    assert lazy[0] is first
+    lazy[2]
+
+    # Row 1 was used least recently, so it made room for row 2
+    assert list(lazy._rows) == [0, 2]
+    assert lazy[0] is first
+    assert lazy.nbytes == 2 * len(coordinates) * 8
+
+    lazy[1]
+    assert list(lazy._rows) == [0, 1]
+    assert np.allclose(lazy[2], data_import.build_distance_matrix(coordinates)[2])
+
+
+def test_without_cache_no_rows_are_kept(coordinates):
+    lazy = LazyDistanceMatrix(coordinates, cache_rows=0)
+
+    assert np.allclose(lazy[5], data_import.build_distance_matrix(coordinates)[5])
+    assert lazy.nbytes == 0
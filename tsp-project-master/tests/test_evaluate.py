@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from src import data_import, evaluate
+from src.distance import LazyDistanceMatrix
+
+from conftest import build_args
+
+
+def reference_lengths(tours, distance_matrix):
+    """ The length of every tour, one edge at a time """
+    return np.array([sum(distance_matrix[tour[i]][tour[(i + 1) % len(tour)]] for i in range(len(tour)))
+                     for tour in tours])
+
+
+@pytest.fixture
+def tours():
+    rng = np.random.default_rng(0)
+    return np.argsort(rng.random((25, 60)), axis=1).astype(np.int32)
+
+
+@pytest.fixture
+def coordinates():
+    return np.random.default_rng(1).uniform(0, 1000, (60, 2))
+
+
+@pytest.mark.parametrize('chunk_size', [None, 1, 7, 25, 100])
+def test_chunked_lengths_match_the_reference(tours, coordinates, chunk_size):
+    distance_matrix = data_import.build_distance_matrix(coordinates)
+
+    lengths = evaluate.tour_lengths(tours, distance_matrix, chunk_size)
+
+    assert np.allclose(lengths, reference_lengths(tours, distance_matrix))
+
+
+def test_single_and_list_tours(tours, coordinates):
+    distance_matrix = data_import.build_distance_matrix(coordinates)
+    expected = evaluate.tour_lengths(tours, distance_matrix)
+
+    assert np.allclose(evaluate.tour_lengths(tours[3], distance_matrix), expected[3:4])
+    assert np.allclose(evaluate.tour_lengths(tours.tolist(), distance_matrix), expected)
+
+
+@pytest.mark.parametrize('chunk_size', [None, 4])
+def test_float32_and_lazy_lengths_match_the_dense_lengths(tours, coordinates, chunk_size):
+    dense = evaluate.tour_lengths(tours, data_import.build_distance_matrix(coordinates))
+
+    float32 = evaluate.tour_lengths(tours, data_import.build_distance_matrix(coordinates, np.float32), chunk_size)
+    lazy = evaluate.tour_lengths(tours, LazyDistanceMatrix(coordinates, cache_rows=4), chunk_size)
+    lazy32 = evaluate.tour_lengths(tours, LazyDistanceMatrix(coordinates, np.float32), chunk_size)
+
+    assert np.allclose(lazy, dense)
+    assert np.allclose(float32, dense, rtol=1e-5)
+    assert np.allclose(lazy32, dense, rtol=1e-5)
+
+
+def test_eval_population_with_a_lazy_matrix():
+    args = build_args(number_of_cities=50)
+    dense_fitness = args['population'].fitness.copy()
+
+    args['distance_matrix'] = LazyDistanceMatrix(args['coordinates'])
+    evaluate.eval_population(args)
+
+    assert np.allclose(args['population'].fitness, dense_fitness)
+    assert np.allclose(dense_fitness, -reference_lengths(args['population'].tours,
+                                                         data_import.build_distance_matrix(args['coordinates'])))
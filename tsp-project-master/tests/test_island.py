@@ -0,0 +1,31 @@
+import pytest
+
+from src import island
+
+
+@pytest.mark.parametrize('interval', [0, -5])
+def test_migration_interval_below_one_is_rejected(args, interval):
+    args['islands'] = 2
+    args['migration_interval'] = interval
+
+    with pytest.raises(SystemExit):
+        island.run_islands(args)
+
+
+@pytest.mark.parametrize('quiet, console_interval, expected_lines', [
+    (True, 1, 0),
+    (False, 1, 2 * 6),
+    (False, 3, 2 * 2),
+])
+def test_islands_print_generations_like_the_serial_runs(args, capfd, quiet, console_interval, expected_lines):
+    args['islands'] = 2
+    args['generations'] = 6
+    args['migration_interval'] = 2
+    args['console_interval'] = console_interval
+
+    island.run_islands(args, quiet)
+
+    lines = [line for line in capfd.readouterr().out.splitlines() if line.startswith("Island ")
+             and ", generation " in line]
+    assert len(lines) == expected_lines
+    assert len(args['population'].tours) == args['pop_size']
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from src import evaluate, initialize
+from src.local_search import LocalSearch
+from src.utility import inverse_permutation
+
+from conftest import build_args
+
+
+@pytest.mark.parametrize('or_opt', [False, True])
+def test_descent_ends_in_a_two_opt_local_optimum(or_opt):
+    args = build_args(number_of_cities=200)
+    search = LocalSearch(args['distance_matrix'], args['neighbours'], or_opt)
+    tour = initialize.nearest_neighbour(args).astype(np.int32)
+    before = evaluate.tour_lengths(tour, args['distance_matrix'])[0]
+
+    moves, gain = search.descend(tour)
+
+    assert moves > 0
+    assert np.array_equal(np.sort(tour), np.arange(len(tour)))
+    after = evaluate.tour_lengths(tour, args['distance_matrix'])[0]
+    assert after == pytest.approx(before - gain)
+
+    # No candidate 2-opt move improves the tour any more
+    for city in range(len(tour)):
+        move_gain, touched = search.two_opt_move(tour.copy(), inverse_permutation(tour), city)
+        assert move_gain == 0.0
@@ -0,0 +1,109 @@
+import functools
+
+import numpy as np
+import pytest
+
+from src import evaluate, offspring_generation
+from src.utility import inverse_permutation
+
+from conftest import build_args
+
+
+@pytest.mark.parametrize('name', ['nn_inversion', 'nn_insertion', 'nn_swap', 'nn_cyclic'])
+def test_guided_mutation_keeps_positions_up_to_date(args, name):
+    mutation_func = offspring_generation.MUTATION_FUNCTIONS[name]
+    individual = args['population'].tours[0].copy()
+    positions = inverse_permutation(individual)
+
+    for i in range(200):
+        mutation_func(individual, args['rng'], neighbours=args['neighbours'], positions=positions)
+
+        assert np.array_equal(np.sort(individual), np.arange(len(individual)))
+        assert np.array_equal(positions, inverse_permutation(individual))
+
+
+@pytest.mark.parametrize('name', ['scramble', 'inversion', 'insertion', 'two_opt'])
+def test_mutation_outside_short_chromosome_leaves_it_unchanged(name):
+    # With 3 cities, every pair of points 3 apart falls outside the chromosome
+    args = build_args(number_of_cities=3)
+    population = args['population']
+    mutation_func = offspring_generation.MUTATION_FUNCTIONS[name]
+
+    for tour in population.tours:
+        individual = tour.copy()
+        assert mutation_func(individual, args['rng'], length=3) == ([], [])
+        assert np.array_equal(individual, tour)
+
+
+def test_mutation_with_long_clusters_keeps_tours_and_fitness(args):
+    # kca_k is so small that the cluster length is the whole chromosome, so
+    # every sampled pair of points falls outside it
+    args['kca_k'] = 1.5 / len(args['coordinates'])
+    args['mutation'] = 'inversion'
+    args['mutation_rate'] = 1.0
+    population = args['population']
+    offspring = population.tours[:population.offspring_size].copy()
+    population.offspring[:] = offspring
+    population.offspring_fitness[:] = population.fitness[:population.offspring_size]
+    population.offspring_dirty[:] = False
+
+    offspring_generation.mutation(args)
+
+    assert np.array_equal(population.offspring, offspring)
+    for tour in population.offspring:
+        assert np.array_equal(np.sort(tour), np.arange(len(tour)))
+    assert np.array_equal(population.offspring_fitness, population.fitness[:population.offspring_size])
+
+
+@pytest.mark.parametrize('number_of_cities', [5, 6, 8, 100])
+@pytest.mark.parametrize('name', sorted(offspring_generation.MUTATION_FUNCTIONS))
+def test_mutation_edges_give_the_exact_fitness_change(name, number_of_cities):
+    args = build_args(number_of_cities=number_of_cities, seed=number_of_cities)
+    distance_matrix = args['distance_matrix']
+    mutation_func = offspring_generation.MUTATION_FUNCTIONS[name]
+    if name in offspring_generation.GUIDED_MUTATION_FUNCTIONS:
+        mutation_func = functools.partial(mutation_func, neighbours=args['neighbours'])
+
+    individual = args['population'].tours[0].copy()
+    length = evaluate.tour_lengths(individual, distance_matrix)[0]
+    for i in range(300):
+        removed, added = mutation_func(individual, args['rng'], length=1 + i % number_of_cities)
+        length += evaluate.edge_delta(distance_matrix, removed, added)
+
+        assert np.array_equal(np.sort(individual), np.arange(number_of_cities))
+        assert length == pytest.approx(evaluate.tour_lengths(individual, distance_matrix)[0])
+
+
+@pytest.mark.parametrize('name', sorted(offspring_generation.MUTATION_FUNCTIONS))
+def test_mutated_offspring_keep_their_fitness_up_to_date(args, name):
+    args['mutation'] = name
+    args['mutation_rate'] = 1.0
+    population = args['population']
+    population.offspring[:] = population.tours[:population.offspring_size]
+    population.offspring_fitness[:] = population.fitness[:population.offspring_size]
+    population.offspring_dirty[:] = False
+
+    for i in range(20):
+        offspring_generation.mutation(args)
+
+    assert np.allclose(population.offspring_fitness,
+                       -evaluate.tour_lengths(population.offspring, args['distance_matrix']))
+
+
+def test_guided_mutation_gets_the_positions_of_its_offspring(args, monkeypatch):
+    received = []
+
+    def recording_nn_swap(individual, rng, length=-1, neighbours=None, positions=None):
+        assert np.array_equal(positions, inverse_permutation(individual))
+        received.append(positions)
+        return offspring_generation.nn_swap(individual, rng, length, neighbours, positions)
+
+    monkeypatch.setitem(offspring_generation.MUTATION_FUNCTIONS, 'nn_swap', recording_nn_swap)
+    args['mutation'] = 'nn_swap'
+    args['mutation_rate'] = 1.0
+    population = args['population']
+    population.offspring[:] = population.tours[:population.offspring_size]
+
+    offspring_generation.mutation(args)
+
+    assert len(received) == args['population'].offspring_size
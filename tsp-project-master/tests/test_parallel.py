@@ -0,0 +1,28 @@
+import numpy as np
+
+from src import data_import, parallel
+
+from conftest import build_args
+
+
+def test_memory_mapped_distance_matrix_is_not_copied(tmp_path):
+    args = build_args()
+    path = str(tmp_path / 'distance.npy')
+    data_import.save_cache(path, args['distance_matrix'])
+    args['distance_matrix'] = data_import.load_cache(path, args['distance_matrix'].shape, np.float64)
+
+    blocks, instance = parallel.share_instance(args)
+    try:
+        assert instance['distance_matrix'][0] == 'mmap'
+        assert len(blocks) == 2
+
+        attached_blocks, arrays = parallel.attach_instance(instance)
+        assert isinstance(arrays['distance_matrix'], np.memmap)
+        assert np.array_equal(arrays['distance_matrix'], args['distance_matrix'])
+        assert np.array_equal(arrays['coordinates'], args['coordinates'])
+        for block in attached_blocks:
+            block.close()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
@@ -0,0 +1,120 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from src import offspring_generation
+
+
+def reference_cut_crossfill(parent1, parent2, crossover_point):
+    """ The original loop of cut-and-crossfill crossover, for one offspring """
+    chromosome_length = len(parent1)
+    crossover_idx = crossover_point + 1
+    offspring = parent1.copy()
+    offspring_idx = crossover_idx
+
+    while offspring_idx != chromosome_length:
+        parent_allele = parent2[crossover_idx]
+        if parent_allele not in offspring[:offspring_idx]:
+            offspring[offspring_idx] = parent_allele
+            offspring_idx += 1
+        crossover_idx = (crossover_idx + 1) % chromosome_length
+
+    return offspring
+
+
+def reference_best_order(parent1, parent2, best_individual, q, parent_choices):
+    """ The original per-sub-sequence loop of best-order crossover """
+    def order_by(subset, full_set):
+        return sorted(subset, key=list(full_set).index)
+
+    offspring1 = np.zeros(len(parent1), dtype=int)
+    offspring2 = np.zeros(len(parent2), dtype=int)
+
+    for i in range(len(q) - 1):
+        sp, ep = q[i], q[i + 1]
+        if parent_choices[i] == 1:
+            alleles1, alleles2 = parent1[sp:ep], parent2[sp:ep]
+        if parent_choices[i] == 2:
+            alleles1, alleles2 = order_by(parent1[sp:ep], parent2), order_by(parent2[sp:ep], parent1)
+        if parent_choices[i] == 3:
+            alleles1 = order_by(parent1[sp:ep], best_individual)
+            alleles2 = order_by(parent2[sp:ep], best_individual)
+        offspring1[sp:ep] = alleles1
+        offspring2[sp:ep] = alleles2
+
+    return offspring1, offspring2
+
+
+def legal_cutting_points(J, n):
+    """ Every cutting point sequence with sub-sequences of 1 to J / 3 alleles """
+    return {points for points in itertools.combinations(range(1, J), n - 2)
+            if np.diff((0,) + points + (J,)).max() <= J // 3}
+
+
+@pytest.mark.parametrize('chromosome_length', [4, 5, 17, 60])
+def test_batch_cut_crossfill_matches_the_reference(chromosome_length):
+    rng = np.random.default_rng(chromosome_length)
+    parents1 = np.argsort(rng.random((50, chromosome_length)), axis=1)
+    parents2 = np.argsort(rng.random((50, chromosome_length)), axis=1)
+    crossover_points = rng.integers(0, chromosome_length - 2, size=50)
+
+    offspring1, offspring2 = offspring_generation.batch_cut_crossfill(
+        parents1, parents2, rng, crossover_points)
+
+    for i, point in enumerate(crossover_points):
+        assert np.array_equal(offspring1[i], reference_cut_crossfill(parents1[i], parents2[i], point))
+        assert np.array_equal(offspring2[i], reference_cut_crossfill(parents2[i], parents1[i], point))
+
+
+@pytest.mark.parametrize('J, n', [(9, 5), (30, 10), (100, 12)])
+def test_best_order_matches_the_reference(J, n):
+    rng = np.random.default_rng(J)
+    for i in range(20):
+        parent1, parent2, best_individual = np.argsort(rng.random((3, J)), axis=1)
+        q = offspring_generation.sample_cutting_points(J, n, rng)[0]
+
+        # best_order draws the parent choices right after the cutting points
+        seed = int(rng.integers(2 ** 31))
+        parent_choices = np.random.default_rng(seed).integers(1, 4, size=n - 1)
+        offspring = offspring_generation.best_order(
+            J, n, parent1, parent2, best_individual, np.random.default_rng(seed), cutting_points=q)
+
+        expected = reference_best_order(parent1, parent2, best_individual, q, parent_choices)
+        assert np.array_equal(offspring[0], expected[0])
+        assert np.array_equal(offspring[1], expected[1])
+
+
+@pytest.mark.parametrize('J, n', [(9, 5), (10, 5), (12, 6)])
+@pytest.mark.parametrize('sampler', [offspring_generation.sample_cutting_points,
+                                     offspring_generation.construct_cutting_points])
+def test_cutting_points_are_valid_and_cover_every_configuration(J, n, sampler):
+    q = sampler(J, n, np.random.default_rng(0), 20000)
+
+    assert q.shape == (20000, n)
+    assert np.all(q[:, 0] == 0) and np.all(q[:, -1] == J)
+    lengths = np.diff(q, axis=1)
+    assert np.all((lengths >= 1) & (lengths <= J // 3))
+
+    # Every legal configuration turns up, about equally often
+    legal = legal_cutting_points(J, n)
+    points, counts = np.unique(q[:, 1:-1], axis=0, return_counts=True)
+    assert set(map(tuple, points.tolist())) == legal
+    expected = len(q) / len(legal)
+    assert np.all(np.abs(counts - expected) < 0.35 * expected)
+
+
+@pytest.mark.parametrize('J, n', [(30, 4), (30, 30), (5, 5)])
+def test_impossible_cutting_points_are_rejected(J, n):
+    assert offspring_generation.check_cutting_points(J, n) is not None
+    with pytest.raises(ValueError):
+        offspring_generation.sample_cutting_points(J, n, np.random.default_rng(0))
+
+
+def test_recombination_stops_on_impossible_cutting_points(args):
+    args['box_cutting_points_n'] = len(args['coordinates'])
+    args['mating_pool'] = np.arange(args['mp_size'])
+    args['crossover_rate'] = 1.0
+
+    with pytest.raises(SystemExit):
+        offspring_generation.recombination(args)
@@ -0,0 +1,24 @@
+from src import runner
+
+
+class StubPlotter(object):
+    """ Records what the real plotter would send to its process """
+
+    def __init__(self, args):
+        self.args = args
+        self.frames = []
+
+    def plot(self):
+        self.frames.append((self.args['max'], self.args['mean'], self.args['sd']))
+
+
+def test_visualized_generation_has_statistics(args):
+    args['plotter'] = StubPlotter(args)
+
+    runner.evolve(args, 0, visualize=True)
+
+    assert len(args['plotter'].frames) == 1
+    best, mean, sd = args['plotter'].frames[0]
+    assert best == -args['population'].fitness.max()
+    assert mean >= best
+    assert sd >= 0
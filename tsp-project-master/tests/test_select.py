@@ -0,0 +1,73 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from src import evaluate, select
+from src.utility import canonical_tour_key
+
+
+@pytest.mark.parametrize('pressure', [1.0, 1.5, 2.0])
+def test_rank_tournament_selection_without_warnings(args, pressure):
+    args['parent_selection'] = 'rank_tournament'
+    args['selection_pressure'] = pressure
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        select.parents(args)
+
+    mating_pool = args['mating_pool']
+    assert len(mating_pool) == args['mp_size']
+    assert np.all((0 <= mating_pool) & (mating_pool < args['pop_size']))
+
+    # With the highest pressure the worst individual has no chance to enter
+    # a tournament, and it can not win one anyway
+    if pressure == 2.0:
+        assert args['population'].fitness.argmin() not in mating_pool
+
+
+def fill_with_copies(args, distinct_tours, rng):
+    """ Make every parent and offspring a rotated or reversed copy of one of the tours """
+    population = args['population']
+    all_tours = population.all_tours
+    for i in range(len(all_tours)):
+        tour = np.roll(distinct_tours[i % len(distinct_tours)], rng.integers(len(all_tours[i])))
+        all_tours[i] = tour[::-1] if rng.random() < 0.5 else tour
+    population.all_fitness[:] = -evaluate.tour_lengths(all_tours, args['distance_matrix'])
+
+
+def test_dedup_survivors_are_distinct(args):
+    args['survivor_dedup'] = True
+    population = args['population']
+    distinct_tours = population.tours.copy()
+    fill_with_copies(args, distinct_tours, args['rng'])
+
+    select.survivors(args)
+
+    keys = [canonical_tour_key(tour) for tour in population.tours]
+    assert len(set(keys)) == len(keys)
+    assert set(keys) == {canonical_tour_key(tour) for tour in distinct_tours}
+    assert args['duplicates_dropped'] == population.offspring_size
+
+
+def test_dedup_fills_up_with_the_best_duplicates(args):
+    args['survivor_dedup'] = True
+    population = args['population']
+    distinct_tours = population.tours[:3].copy()
+    fill_with_copies(args, distinct_tours, args['rng'])
+    # Copies can differ from each other in the last bits of their fitness
+    all_fitness = np.round(population.all_fitness, 6)
+
+    select.survivors(args)
+
+    # Every distinct tour survives once, and the rest of the population
+    # are the best of the remaining copies
+    keys = [canonical_tour_key(tour) for tour in population.tours]
+    assert set(keys) == {canonical_tour_key(tour) for tour in distinct_tours}
+    distinct_fitness = np.unique(all_fitness)
+    duplicate_fitness = np.sort(all_fitness)[::-1]
+    for fitness in distinct_fitness:
+        duplicate_fitness = np.delete(duplicate_fitness, np.flatnonzero(duplicate_fitness == fitness)[0])
+    expected = np.concatenate((distinct_fitness, duplicate_fitness[:population.pop_size - 3]))
+    assert np.allclose(np.sort(np.round(population.fitness, 6)), np.sort(expected))
+    assert args['duplicates_dropped'] == len(all_fitness) - population.pop_size
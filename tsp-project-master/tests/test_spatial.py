@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from src.spatial import GridIndex
+
+
+def point_set(kind, number_of_points=400):
+    rng = np.random.default_rng(number_of_points)
+    if kind == 'uniform':
+        return rng.uniform(0, 1000, (number_of_points, 2))
+    if kind == 'clustered':
+        centres = rng.uniform(0, 10000, (5, 2))
+        return centres[rng.integers(5, size=number_of_points)] + rng.normal(0, 5, (number_of_points, 2))
+    if kind == 'collinear':
+        t = rng.uniform(0, 1000, number_of_points)
+        return np.stack((t, 2 * t + 3), axis=1)
+    if kind == 'vertical':
+        return np.stack((np.full(number_of_points, 7.0), rng.uniform(0, 1000, number_of_points)), axis=1)
+    if kind == 'coincident':
+        return np.repeat(rng.uniform(0, 1000, (number_of_points // 20, 2)), 20, axis=0)
+
+
+def brute_force_distances(points, queries):
+    return np.sqrt(((queries[:, np.newaxis, :] - points[np.newaxis, :, :]) ** 2).sum(axis=2))
+
+
+KINDS = ['uniform', 'clustered', 'collinear', 'vertical', 'coincident']
+
+
+@pytest.mark.parametrize('kind', KINDS)
+@pytest.mark.parametrize('k', [1, 8, 30])
+def test_nearest_cities_match_brute_force(kind, k):
+    points = point_set(kind)
+    index = GridIndex(points)
+    cities = np.arange(len(points))
+
+    indices, distances = index.nearest_cities(cities, k)
+
+    all_distances = brute_force_distances(points, points)
+    all_distances[cities, cities] = np.inf
+    expected = np.sort(all_distances, axis=1)[:, :k]
+
+    # Ties can be broken either way, so compare the distances, and check
+    # that the indices are distinct other cities at those distances
+    assert np.allclose(distances, expected)
+    assert np.allclose(all_distances[cities[:, np.newaxis], indices], distances)
+    assert np.all(indices != cities[:, np.newaxis])
+    assert all(len(set(row)) == k for row in indices.tolist())
+
+
+@pytest.mark.parametrize('kind', KINDS)
+def test_knn_of_other_points_matches_brute_force(kind):
+    points = point_set(kind)
+    queries = np.random.default_rng(1).uniform(points.min(axis=0) - 50, points.max(axis=0) + 50, (100, 2))
+    index = GridIndex(points)
+
+    indices, distances = index.knn(queries, 10)
+
+    expected = np.sort(brute_force_distances(points, queries), axis=1)[:, :10]
+    assert np.allclose(distances, expected)
+
+
+@pytest.mark.parametrize('number_of_points', [2, 3, 10])
+@pytest.mark.parametrize('extra', [0, 1, 5])
+def test_knn_with_k_at_least_n_minus_one(number_of_points, extra):
+    points = point_set('uniform', number_of_points)
+    cities = np.arange(number_of_points)
+    k = number_of_points - 1 + extra
+
+    indices, distances = GridIndex(points).nearest_cities(cities, k)
+
+    # Every other city is returned, nearest first
+    assert indices.shape == (number_of_points, number_of_points - 1)
+    for city in cities:
+        assert set(indices[city].tolist()) == set(cities.tolist()) - {city}
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+
+@pytest.mark.parametrize('kind', KINDS)
+@pytest.mark.parametrize('radius', [0.0, 10.0, 150.0])
+def test_cities_within_match_brute_force(kind, radius):
+    points = point_set(kind)
+    cities = np.arange(len(points))
+
+    neighbours = GridIndex(points).cities_within(cities, radius)
+
+    all_distances = brute_force_distances(points, points)
+    for city, found in zip(cities, neighbours):
+        expected = np.flatnonzero(all_distances[city] <= radius)
+        assert set(found.tolist()) == set(expected.tolist()) - {city}
+        assert np.all(np.diff(all_distances[city, found]) >= 0)
@@ -0,0 +1,36 @@
+import json
+
+import numpy as np
+
+from src import select, telemetry
+
+
+def test_every_generation_records_the_dropped_duplicates(args, tmp_path):
+    path = str(tmp_path / 'telemetry.jsonl')
+    args['telemetry_file'] = path
+    args['survivor_dedup'] = True
+    metrics = telemetry.Telemetry(args, quiet=True)
+
+    # The offspring are copies of the parents, so all of them are dropped
+    population = args['population']
+    population.offspring[:] = population.tours[:population.offspring_size]
+    population.offspring_fitness[:] = population.fitness[:population.offspring_size]
+    select.survivors(args)
+    metrics.record(args, 0)
+    metrics.close()
+
+    with open(path) as fp:
+        records = [json.loads(line) for line in fp]
+    assert [record['duplicates_dropped'] for record in records] == [population.offspring_size]
+
+
+def test_binary_log_has_the_dropped_duplicates(args, tmp_path):
+    path = str(tmp_path / 'telemetry.bin')
+    args['telemetry_file'] = path
+    args['telemetry_format'] = 'binary'
+    args['duplicates_dropped'] = 3
+    metrics = telemetry.Telemetry(args, quiet=True)
+    metrics.record(args, 0)
+    metrics.close()
+
+    assert np.array_equal(telemetry.load_telemetry(path)['duplicates_dropped'], [3])